@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Differential accuracy check of the fast coefficient paths.
+
+Every fast path is compared with the reference: the scalar designs of
+biquad.py (scipy bilinear transform) and the scalar quantization of the
+original BQReg.ba_to_reg. Randomized parameter sets are checked in chunks
+spread over a process pool; for every case the harness compares
+    coef  max. absolute coefficient difference (sos, a0 = 1)
+    db    max. magnitude response difference in dB (floor -120 dB)
+    lsb   max. difference of the 3.23 register values in LSB
+and reports the worst case and the throughput of both paths.
+
+Paths:
+    lowpass, highpass, allpass  closed form designs of crossover.py
+    quantize                    vectorized BQReg.sos_to_reg, incl. rounding ties
+    dequantize                  BQReg.reg_to_sos against BQReg.reg_to_ba
+    table                       interpolated designs of a coeftable.py table
+
+    python3 accuracy.py -n 1000000 --fs 48000
+    python3 accuracy.py table --table peaking48k -n 100000
+    python3 accuracy.py --replay failures.jsonl
+
+Cases beyond the tolerances are simplified (parameters rounded to as few
+digits as possible while still failing) and written to `--failures` as JSON
+lines, which `--replay` checks again.
+"""
+
+import argparse
+import json
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import biquad
+import crossover
+from cascade import Cascade
+from coeftable import CoefTable, _exact
+from tas5713 import BQReg, COEF_3_23_MASK
+
+# number of cases per process pool job
+CHUNK = 4096
+
+# default tolerances, None: reported only
+TOLERANCES = {
+    'closed': {'coef': 1e-9, 'db': 1e-6, 'lsb': 1},
+    'quantize': {'coef': 0.0, 'db': None, 'lsb': 0},
+    'table': {'coef': None, 'db': None, 'lsb': None},  # db: error bound of the table
+}
+
+# floor of the response comparison
+FLOOR_DB = -120.
+
+
+def _reference_reg(sos):
+    """ scalar quantization as done by the original BQReg.ba_to_reg """
+    reg = bytearray()
+    coef_fmt = struct.Struct('>i')
+    for b0, b1, b2, _, a1, a2 in sos:
+        for c in (b0, b1, b2, -a1, -a2):
+            reg += coef_fmt.pack(int(round(c * 2 ** 23)))
+            reg[-4] &= 0x03
+    return bytes(reg)
+
+
+def _log_uniform(rng, lo, hi, n):
+    return np.exp(rng.uniform(np.log(lo), np.log(hi), n))
+
+
+# closed form designs
+
+_CLOSED = {
+    'lowpass': (crossover.lowpass, biquad.lowpass),
+    'highpass': (crossover.highpass, biquad.highpass),
+    'allpass': (crossover.allpass, biquad.allpass),
+}
+
+
+def _sample_closed(rng, n, fs, table):
+    return {'f': _log_uniform(rng, 5., 0.45 * fs, n), 'Q': _log_uniform(rng, 0.1, 20., n)}
+
+
+def _closed_fast(name):
+    def fast(p, fs, table):
+        sos = _CLOSED[name][0](crossover._k(p['f'], fs), p['Q'])
+        return sos, BQReg.sos_to_reg(sos)
+    return fast
+
+
+def _closed_ref(name):
+    def ref(p, fs, table):
+        sos = np.empty((len(p['f']), 6))
+        for i, (f, q) in enumerate(zip(p['f'], p['Q'])):
+            b, a = _CLOSED[name][1](2. * f / fs, q)
+            sos[i] = np.real(np.concatenate((b, a))) / np.real(a[0])
+        return sos, _reference_reg(sos)
+    return ref
+
+
+# quantization
+
+def _sample_quantize(rng, n, fs, table):
+    c = rng.uniform(-4., 4., (n, 5))
+    # a quarter of the values exactly on a rounding tie
+    ties = rng.uniform(size=(n, 5)) < 0.25
+    c[ties] = (np.floor(c[ties] * 2 ** 23) + 0.5) * 2 ** -23
+    return dict(('c{}'.format(i), c[:, i]) for i in range(5))
+
+
+def _quantize_sos(p):
+    n = len(p['c0'])
+    return np.column_stack((p['c0'], p['c1'], p['c2'], np.ones(n), p['c3'], p['c4']))
+
+
+def _quantize_fast(p, fs, table):
+    sos = _quantize_sos(p)
+    return sos, BQReg.sos_to_reg(sos)
+
+
+def _quantize_ref(p, fs, table):
+    sos = _quantize_sos(p)
+    return sos, _reference_reg(sos)
+
+
+def _sample_dequantize(rng, n, fs, table):
+    raw = rng.randint(0, 1 << 26, (n, 5))
+    return dict(('r{}'.format(i), raw[:, i].astype(np.float64)) for i in range(5))
+
+
+def _dequantize_reg(p):
+    raw = np.column_stack([p['r{}'.format(i)] for i in range(5)]).astype(np.int64)
+    return raw.astype('>u4').tobytes()
+
+
+def _dequantize_fast(p, fs, table):
+    sos = BQReg.reg_to_sos(_dequantize_reg(p))
+    # the round trip has to give the register values again
+    return sos, BQReg.sos_to_reg(sos)
+
+
+def _dequantize_ref(p, fs, table):
+    reg = _dequantize_reg(p)
+    sos = np.empty((len(reg) // BQReg.size, 6))
+    for i in range(len(sos)):
+        b, a = BQReg.reg_to_ba(reg[i * BQReg.size:(i + 1) * BQReg.size])
+        sos[i] = b + a
+    return sos, reg
+
+
+# interpolation tables
+
+def _sample_table(rng, n, fs, table):
+    (f0, f1, _), (g0, g1, _), (x0, x1, _) = table.meta['axes']
+    return {'f': _log_uniform(rng, f0, f1, n), 'gain': rng.uniform(g0, g1, n), 'x': _log_uniform(rng, x0, x1, n)}
+
+
+def _table_fast(p, fs, table):
+    sos = table.design_many(p['f'], p['gain'], p['x'])
+    return sos, BQReg.sos_to_reg(sos)
+
+
+def _table_ref(p, fs, table):
+    sos = _exact(table.ftype, table.fs, p['f'], p['gain'], p['x'])
+    return sos, _reference_reg(sos)
+
+
+PATHS = {
+    # name: (sampler, fast, reference, tolerance class, compare responses)
+    'lowpass': (_sample_closed, _closed_fast('lowpass'), _closed_ref('lowpass'), 'closed', True),
+    'highpass': (_sample_closed, _closed_fast('highpass'), _closed_ref('highpass'), 'closed', True),
+    'allpass': (_sample_closed, _closed_fast('allpass'), _closed_ref('allpass'), 'closed', True),
+    'quantize': (_sample_quantize, _quantize_fast, _quantize_ref, 'quantize', False),
+    'dequantize': (_sample_dequantize, _dequantize_fast, _dequantize_ref, 'quantize', False),
+    'table': (_sample_table, _table_fast, _table_ref, 'table', True),
+}
+
+_tables = {}
+
+
+def _load_table(path):
+    """ table of a worker process, loaded once """
+    if path is None:
+        return None
+    if path not in _tables:
+        _tables[path] = CoefTable.load(path)
+    return _tables[path]
+
+
+def tolerances(name, table=None):
+    tol = dict(TOLERANCES[PATHS[name][3]])
+    if name == 'table':
+        tol['db'] = table.error_db
+    return tol
+
+
+def _reg_values(reg):
+    fix = np.frombuffer(reg, dtype='>u4').astype(np.int64) & COEF_3_23_MASK
+    return ((fix ^ 0x02000000) - 0x02000000).reshape(-1, 5)
+
+
+def errors(name, fast, ref, fs, worN=64):
+    """ per case errors of a fast path against the reference
+    :param fast: tuple(sos, reg) of the fast path
+    :param ref: tuple(sos, reg) of the reference
+    :return: dict of arrays 'coef', 'db', 'lsb'
+    """
+    (sos, reg), (ref_sos, ref_reg) = fast, ref
+    err = {
+        'coef': np.max(np.abs(sos - ref_sos), axis=1),
+        'lsb': np.max(np.abs(_reg_values(reg) - _reg_values(ref_reg)), axis=1).astype(np.float64),
+        'db': np.zeros(len(sos)),
+    }
+    if PATHS[name][4]:
+        freqs = np.geomspace(10., 0.49 * fs, worN)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            _, h = Cascade(sos).sections_response(freqs, fs)
+            _, h_ref = Cascade(ref_sos).sections_response(freqs, fs)
+            db = 20 * np.log10(np.maximum(np.abs(h), 10 ** (FLOOR_DB / 20)))
+            db_ref = 20 * np.log10(np.maximum(np.abs(h_ref), 10 ** (FLOOR_DB / 20)))
+        err['db'] = np.max(np.abs(db - db_ref), axis=1)
+    for k in err:
+        err[k] = np.where(np.isfinite(err[k]), err[k], np.inf)
+    return err
+
+
+def _failed(err, tol):
+    failed = np.zeros(len(err['coef']), dtype=bool)
+    for k, t in tol.items():
+        if t is not None:
+            failed |= err[k] > t
+    return failed
+
+
+def check(name, params, fs, table=None, worN=64):
+    """ run the fast path and the reference on `params`
+    :return: tuple(errors, failed mask, fast time, reference time)
+    """
+    _, fast, ref, _, _ = PATHS[name]
+    t0 = time.perf_counter()
+    f = fast(params, fs, table)
+    t1 = time.perf_counter()
+    r = ref(params, fs, table)
+    t2 = time.perf_counter()
+    err = errors(name, f, r, fs, worN)
+    return err, _failed(err, tolerances(name, table)), t1 - t0, t2 - t1
+
+
+def _run_chunk(job):
+    name, fs, seed, index, n, table_path, max_failures, worN = job
+    table = _load_table(table_path)
+    rng = np.random.RandomState([seed, index])
+    params = PATHS[name][0](rng, n, fs, table)
+    err, failed, t_fast, t_ref = check(name, params, fs, table, worN)
+    worst = dict((k, float(np.max(v))) for k, v in err.items())
+    cases = []
+    for i in np.flatnonzero(failed)[:max_failures]:
+        cases.append({'params': dict((k, float(v[i])) for k, v in params.items()),
+                      'errors': dict((k, float(v[i])) for k, v in err.items())})
+    return name, n, worst, int(np.count_nonzero(failed)), cases, t_fast, t_ref
+
+
+def _rounded(v, digits):
+    return float('{:.{}g}'.format(v, digits))
+
+
+def shrink(name, params, fs, table=None, worN=64):
+    """ round every parameter to the fewest significant digits which still fail
+    :param params: dict of float, a failing case
+    :return: dict of float
+    """
+    params = dict(params)
+    for key in sorted(params):
+        for digits in range(1, 17):
+            trial = dict(params)
+            trial[key] = _rounded(params[key], digits)
+            if trial[key] == params[key]:
+                break
+            p = dict((k, np.array([v])) for k, v in trial.items())
+            try:
+                _, failed, _, _ = check(name, p, fs, table, worN)
+            except (ValueError, struct.error):
+                continue
+            if failed[0]:
+                params = trial
+                break
+    return params
+
+
+def run(names, n, fs, table_path=None, seed=0, jobs=None, max_failures=10, worN=64):
+    """ check all `names` with `n` random cases each
+    :return: dict name -> summary dict
+    """
+    summary = {}
+    jobs_ = []
+    for name in names:
+        summary[name] = {'n': 0, 'worst': {'coef': 0., 'db': 0., 'lsb': 0.}, 'failed': 0, 'cases': [],
+                         't_fast': 0., 't_ref': 0.}
+        for index, start in enumerate(range(0, n, CHUNK)):
+            jobs_.append((name, fs, seed, index, min(CHUNK, n - start), table_path, max_failures, worN))
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for name, count, worst, failed, cases, t_fast, t_ref in pool.map(_run_chunk, jobs_):
+            s = summary[name]
+            s['n'] += count
+            s['failed'] += failed
+            s['t_fast'] += t_fast
+            s['t_ref'] += t_ref
+            for k, v in worst.items():
+                s['worst'][k] = max(s['worst'][k], v)
+            if len(s['cases']) < max_failures:
+                s['cases'] += cases[:max_failures - len(s['cases'])]
+    wall = time.perf_counter() - t0
+
+    table = _load_table(table_path)
+    for name, s in summary.items():
+        s['wall'] = wall
+        s['tolerances'] = tolerances(name, table)
+        for case in s['cases']:
+            case['params'] = shrink(name, case['params'], fs, table, worN)
+            err, _, _, _ = check(name, dict((k, np.array([v])) for k, v in case['params'].items()), fs, table, worN)
+            case['errors'] = dict((k, float(v[0])) for k, v in err.items())
+    return summary
+
+
+def _write_failures(path, summary, fs, table_path):
+    with open(path, 'w') as f:
+        for name, s in summary.items():
+            for case in s['cases']:
+                json.dump({'path': name, 'fs': fs, 'table': table_path, 'params': case['params'],
+                           'errors': case['errors']}, f)
+                f.write('\n')
+
+
+def replay(path, worN=64):
+    """ check the cases of a failures file again
+    :return: number of cases still failing
+    """
+    failing = 0
+    with open(path) as f:
+        for line in f:
+            case = json.loads(line)
+            table = _load_table(case['table'])
+            p = dict((k, np.array([v])) for k, v in case['params'].items())
+            err, failed, _, _ = check(case['path'], p, case['fs'], table, worN)
+            failing += int(failed[0])
+            print('{:10} {} {}: coef {:.3g}, {:.3g} dB, {:.0f} LSB'.format(
+                case['path'], 'FAIL' if failed[0] else 'ok  ', case['params'],
+                err['coef'][0], err['db'][0], err['lsb'][0]))
+    return failing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='differential accuracy check of the fast coefficient paths')
+    parser.add_argument('paths', nargs='*', metavar='path',
+                        help='{}, default: all except table'.format(', '.join(sorted(PATHS))))
+    parser.add_argument('-n', type=int, default=100000, help='number of random cases per path')
+    parser.add_argument('--fs', type=float, default=48000.)
+    parser.add_argument('--table', default=None, help='coeftable.py table (path without extension)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--worN', type=int, default=64, help='number of frequencies of the response check')
+    parser.add_argument('--failures', default='accuracy-failures.jsonl', help='output of the failing cases')
+    parser.add_argument('--max-failures', type=int, default=10, help='max. saved failing cases per path')
+    parser.add_argument('--replay', default=None, help='check the cases of a failures file again')
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        sys.exit(1 if replay(args.replay, args.worN) else 0)
+
+    names = args.paths or [name for name in sorted(PATHS) if name != 'table']
+    for name in names:
+        if name not in PATHS:
+            parser.error('unknown path {}'.format(name))
+    if 'table' in names and args.table is None:
+        parser.error('table needs --table')
+    fs = args.fs
+    if args.table is not None:
+        # the table defines the sample rate
+        fs = CoefTable.load(args.table).fs
+
+    summary = run(names, args.n, fs, args.table, args.seed, args.jobs, args.max_failures, args.worN)
+
+    print('{:10} {:>9} {:>10} {:>10} {:>5} {:>11} {:>11} {:>7}'.format(
+        'path', 'cases', 'coef', 'dB', 'LSB', 'fast/s', 'ref/s', 'failed'))
+    failed = 0
+    for name, s in summary.items():
+        w = s['worst']
+        print('{:10} {:9d} {:10.3g} {:10.3g} {:5.0f} {:11.0f} {:11.0f} {:7d}'.format(
+            name, s['n'], w['coef'], w['db'], w['lsb'], s['n'] / max(s['t_fast'], 1e-9),
+            s['n'] / max(s['t_ref'], 1e-9), s['failed']))
+        failed += s['failed']
+    print('tolerances: {}'.format(', '.join('{} {}'.format(name, s['tolerances']) for name, s in summary.items())))
+
+    if failed:
+        _write_failures(args.failures, summary, fs, args.table)
+        print('{} failing cases, examples written to {}'.format(failed, args.failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+asyncio client of the TAS5713.
+
+The SMBus ioctls are blocking, so all bus I/O runs on one dedicated executor
+thread per I2C bus. An asyncio lock per bus keeps multi-transaction
+operations (write + verify, bulk programming) of different clients on the
+same bus from interleaving.
+
+    async with await AsyncTAS5713.open() as amp:
+        failed = await amp.program(TAS5713.bq_reg_value(bqs), timeout=2.0)
+
+Operations can be cancelled and take an optional timeout; a transaction
+which is already running on the bus thread is completed, the rest of a bulk
+operation is skipped. For fire-and-forget traffic `submit_write` /
+`submit_read` queue transactions into a pipeline which executes everything
+queued so far in one hop to the bus thread.
+"""
+
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from tas5713 import TAS5713
+
+
+class _Bus:
+    """ executor thread shared by all clients of an I2C bus, one lock per event loop """
+    def __init__(self, bus):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='i2c-{}'.format(bus))
+        self.locks = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock
+
+    def lock(self):
+        """ lock of the running event loop, an asyncio.Lock is bound to the loop it is used in """
+        loop = asyncio.get_running_loop()
+        if loop not in self.locks:
+            self.locks[loop] = asyncio.Lock()
+        return self.locks[loop]
+
+
+class AsyncTAS5713:
+    _buses = {}  # bus id -> _Bus
+
+    def __init__(self, amp, bus=1):
+        """ c'tor, use `open()` to connect without blocking the event loop
+        :param amp:  TAS5713 instance
+        :param bus:  I2C bus id of `amp`
+        """
+        self.amp = amp
+        self._bus = AsyncTAS5713._get_bus(bus)
+        self._queue = None
+        self._worker = None
+
+    @staticmethod
+    def _get_bus(bus):
+        if bus not in AsyncTAS5713._buses:
+            AsyncTAS5713._buses[bus] = _Bus(bus)
+        return AsyncTAS5713._buses[bus]
+
+    @classmethod
+    async def open(cls, bus=1, device_address=0x1b):
+        """ connect to the amp on the bus thread
+        :return: AsyncTAS5713
+        """
+        loop = asyncio.get_running_loop()
+        amp = await loop.run_in_executor(cls._get_bus(bus).executor, TAS5713, bus, device_address)
+        return cls(amp, bus)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _lock(self):
+        return self._bus.lock()
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._bus.executor, func, *args)
+
+    async def _call(self, func, *args):
+        return await self._run(func, *args)
+
+    async def _locked_inner(self, func, args):
+        # the coroutine is created once the lock is held, so the bus I/O begins only then
+        async with self._lock():
+            return await func(*args)
+
+    async def _locked(self, func, args, timeout):
+        """ run coroutine function `func` holding the bus lock, the timeout includes the wait for the lock """
+        return await asyncio.wait_for(self._locked_inner(func, args), timeout)
+
+    async def read_reg(self, reg, timeout=None):
+        """ awaitable TAS5713.read_reg """
+        return await self._locked(self._call, (self.amp.read_reg, reg), timeout)
+
+    async def write_reg(self, reg, data, timeout=None):
+        """ awaitable TAS5713.write_reg """
+        return await self._locked(self._call, (self.amp.write_reg, reg, data), timeout)
+
+    async def _program(self, regvals, verify):
+        failed = []
+        for reg, data in regvals:
+            # one hop to the bus thread per register, cancellation takes effect in between
+            ok = await self._run(self._write_verify, reg, data, verify)
+            if not ok:
+                failed.append(reg)
+        return failed
+
+    def _write_verify(self, reg, data, verify):
+        self.amp.write_reg(reg, data)
+        return not verify or self.amp.read_reg(reg) == data
+
+    async def program(self, regvals, verify=True, timeout=None):
+        """ Write (and verify) a whole register set, holding the bus lock.
+        :param regvals: list[tuple(Reg, bytes),...]
+        :param verify: read back and compare every register
+        :param timeout: seconds for the whole set incl. the wait for the bus lock,
+                        asyncio.TimeoutError if exceeded
+        :return: list of registers which failed verification
+        """
+        return await self._locked(self._program, (regvals, verify), timeout)
+
+    async def _verify(self, regvals):
+        failed = []
+        for reg, data in regvals:
+            if await self._run(self.amp.read_reg, reg) != data:
+                failed.append(reg)
+        return failed
+
+    async def verify(self, regvals, timeout=None):
+        """ Read back a register set.
+        :return: list of registers which differ from `regvals`
+        """
+        return await self._locked(self._verify, (regvals,), timeout)
+
+    def submit_write(self, reg, data):
+        """ Queue a write into the pipeline.
+        :return: asyncio.Future, done when written
+        """
+        return self._submit(self.amp.write_reg, reg, data)
+
+    def submit_read(self, reg):
+        """ Queue a read into the pipeline.
+        :return: asyncio.Future with the register value
+        """
+        return self._submit(self.amp.read_reg, reg)
+
+    def _submit(self, func, *args):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.ensure_future(self._pipeline())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((future, func, args))
+        return future
+
+    async def flush(self):
+        """ wait until all submitted transactions are done """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def _pipeline(self):
+        queue = self._queue
+        try:
+            while True:
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                queued = len(batch)
+                batch = [item for item in batch if not item[0].cancelled()]
+                try:
+                    async with self._lock():
+                        results = await self._run(_execute, batch)
+                    for (future, _, _), (ok, value) in zip(batch, results):
+                        if future.done():
+                            continue
+                        if ok:
+                            future.set_result(value)
+                        else:
+                            future.set_exception(value)
+                except Exception as e:
+                    # e.g. executor shut down, fail the batch and keep serving
+                    for future, _, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                finally:
+                    # on cancellation nothing of the batch is resolved any more
+                    for future, _, _ in batch:
+                        future.cancel()
+                    for _ in range(queued):
+                        queue.task_done()
+        finally:
+            while not queue.empty():
+                queue.get_nowait()[0].cancel()
+                queue.task_done()
+            if self._worker is asyncio.current_task():
+                self._worker = None
+
+    async def close(self):
+        worker = self._worker
+        if worker is not None:
+            await self.flush()
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self._run(self.amp.close)
+
+
+def _execute(batch):
+    """ run a batch of pipelined transactions on the bus thread """
+    results = []
+    for future, func, args in batch:
+        try:
+            results.append((True, func(*args)))
+        except Exception as e:
+            results.append((False, e))
+    return results
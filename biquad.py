@@ -98,8 +98,12 @@ def _transform(b, a, Wn, analog, output):
         return b, a
     elif output in ('ss', 'abcd'):
         return tf2ss(b, a)
-    elif output in ('sos'):
-        raise NotImplementedError('second-order sections not yet implemented')
+    elif output == 'sos':
+        # single section [b0, b1, b2, a0, a1, a2], normalized to a0 = 1
+        sos = np.zeros((1, 6))
+        sos[0, 3 - len(b):3] = np.real(b)
+        sos[0, 6 - len(a):] = np.real(a)
+        return sos / sos[0, 3]
     else:
         raise ValueError('Unknown output type {0}'.format(output))
 
@@ -133,9 +137,9 @@ def lowpass(Wn, Q=1/sqrt(2), analog=False, output='ba'):
     analog : bool, optional
         When True, return an analog filter, otherwise a digital filter is
         returned.
-    output : {'ba', 'zpk', 'ss'}, optional
-        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'), or
-        state-space ('ss').
+    output : {'ba', 'zpk', 'ss', 'sos'}, optional
+        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'),
+        state-space ('ss') or second-order section ('sos').
         Default is 'ba'.
 
     Returns
@@ -146,6 +150,9 @@ def lowpass(Wn, Q=1/sqrt(2), analog=False, output='ba'):
     z, p, k : ndarray, ndarray, float
         Zeros, poles, and system gain of the IIR filter transfer
         function.  Only returned if ``output='zpk'``.
+    sos : ndarray
+        Second-order section of shape (1, 6), [b0, b1, b2, a0, a1, a2].
+        Only returned if ``output='sos'``.
 
     """
     # H(s) = 1 / (s**2 + s/Q + 1)
@@ -184,9 +191,9 @@ def highpass(Wn, Q=1/sqrt(2), analog=False, output='ba'):
     analog : bool, optional
         When True, return an analog filter, otherwise a digital filter is
         returned.
-    output : {'ba', 'zpk', 'ss'}, optional
-        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'), or
-        state-space ('ss').
+    output : {'ba', 'zpk', 'ss', 'sos'}, optional
+        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'),
+        state-space ('ss') or second-order section ('sos').
         Default is 'ba'.
 
     Returns
@@ -197,6 +204,9 @@ def highpass(Wn, Q=1/sqrt(2), analog=False, output='ba'):
     z, p, k : ndarray, ndarray, float
         Zeros, poles, and system gain of the IIR filter transfer
         function.  Only returned if ``output='zpk'``.
+    sos : ndarray
+        Second-order section of shape (1, 6), [b0, b1, b2, a0, a1, a2].
+        Only returned if ``output='sos'``.
 
     """
     # H(s) = s**2 / (s**2 + s/Q + 1)
@@ -240,9 +250,9 @@ def bandpass(Wn, Q=1, type='skirt', analog=False, output='ba'):
     analog : bool, optional
         When True, return an analog filter, otherwise a digital filter is
         returned.
-    output : {'ba', 'zpk', 'ss'}, optional
-        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'), or
-        state-space ('ss').
+    output : {'ba', 'zpk', 'ss', 'sos'}, optional
+        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'),
+        state-space ('ss') or second-order section ('sos').
         Default is 'ba'.
 
     Returns
@@ -253,6 +263,9 @@ def bandpass(Wn, Q=1, type='skirt', analog=False, output='ba'):
     z, p, k : ndarray, ndarray, float
         Zeros, poles, and system gain of the IIR filter transfer
         function.  Only returned if ``output='zpk'``.
+    sos : ndarray
+        Second-order section of shape (1, 6), [b0, b1, b2, a0, a1, a2].
+        Only returned if ``output='sos'``.
 
     """
     if type in (1, 'skirt'):
@@ -296,9 +309,9 @@ def notch(Wn, Q=10, analog=False, output='ba'):
     analog : bool, optional
         When True, return an analog filter, otherwise a digital filter is
         returned.
-    output : {'ba', 'zpk', 'ss'}, optional
-        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'), or
-        state-space ('ss').
+    output : {'ba', 'zpk', 'ss', 'sos'}, optional
+        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'),
+        state-space ('ss') or second-order section ('sos').
         Default is 'ba'.
 
     Returns
@@ -309,6 +322,9 @@ def notch(Wn, Q=10, analog=False, output='ba'):
     z, p, k : ndarray, ndarray, float
         Zeros, poles, and system gain of the IIR filter transfer
         function.  Only returned if ``output='zpk'``.
+    sos : ndarray
+        Second-order section of shape (1, 6), [b0, b1, b2, a0, a1, a2].
+        Only returned if ``output='sos'``.
 
     """
     # H(s) = (s**2 + 1) / (s**2 + s/Q + 1)
@@ -384,9 +400,9 @@ def peaking(Wn, dBgain, Q=None, BW=None, type='half', analog=False, output='ba')
     analog : bool, optional
         When True, return an analog filter, otherwise a digital filter is
         returned.
-    output : {'ba', 'zpk', 'ss'}, optional
-        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'), or
-        state-space ('ss').
+    output : {'ba', 'zpk', 'ss', 'sos'}, optional
+        Type of output:  numerator/denominator ('ba'), pole-zero ('zpk'),
+        state-space ('ss') or second-order section ('sos').
         Default is 'ba'.
 
     Notes
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Biquad cascade, the common data structure of design, response evaluation
+and register quantization.
+
+The sections are stored in one contiguous float64 array of shape (n, 6),
+each row [b0, b1, b2, a0, a1, a2] (same layout as scipy's 'sos' output).
+"""
+
+import numpy as np
+
+# pass-through section, b0=1, a0=1
+IDENTITY = (1., 0., 0., 1., 0., 0.)
+
+
+class Cascade:
+    def __init__(self, sos=()):
+        """ c'tor
+        :param sos: array_like of shape (n, 6) or (6,), no copy if already a
+                    contiguous float64 array
+        """
+        self.sos = np.ascontiguousarray(np.real(sos), dtype=np.float64).reshape(-1, 6)
+
+    @staticmethod
+    def from_ba(bqs):
+        """ Create a cascade from a list of (b, a) tuples
+        :param bqs: list[[b=tuple(3), a=tuple(3)],...]
+        :return: Cascade
+        """
+        return Cascade(np.asarray(bqs).reshape(-1, 6))
+
+    @staticmethod
+    def concatenate(*parts):
+        """ Join cascades or sos arrays into one cascade (one copy only).
+        :param parts: Cascade or array_like of shape (n, 6)
+        :return: Cascade
+        """
+        return Cascade(np.concatenate([as_cascade(p).sos for p in parts]))
+
+    def __len__(self):
+        return len(self.sos)
+
+    def __getitem__(self, index):
+        return Cascade(self.sos[index])
+
+    def __array__(self, dtype=None, copy=None):
+        return self.sos if dtype is None else self.sos.astype(dtype)
+
+    def __add__(self, other):
+        return Cascade.concatenate(self, other)
+
+    def __repr__(self):
+        return 'Cascade({!r})'.format(self.sos)
+
+    @property
+    def b(self):
+        """ numerator coefficients, view of shape (n, 3) """
+        return self.sos[:, :3]
+
+    @property
+    def a(self):
+        """ denominator coefficients, view of shape (n, 3) """
+        return self.sos[:, 3:]
+
+    def padded(self, n):
+        """ Fill up with pass-through sections to a total of `n` sections.
+        :return: Cascade
+        """
+        if len(self) > n:
+            raise ValueError('{} sections do not fit into {}'.format(len(self), n))
+        sos = np.empty((n, 6))
+        sos[:len(self)] = self.sos
+        sos[len(self):] = IDENTITY
+        return Cascade(sos)
+
+    def is_stable(self):
+        """ Check the poles of all sections being inside the unit circle.
+        :return: bool array of shape (n,)
+        """
+        a1 = self.sos[:, 4] / self.sos[:, 3]
+        a2 = self.sos[:, 5] / self.sos[:, 3]
+        return (np.abs(a2) < 1.0) & (np.abs(a1) < 1.0 + a2)
+
+    def sections_response(self, worN=2048, fs=2.0):
+        """ Frequency response of every single section, evaluated at once.
+        :param worN: number of frequencies in [0, fs/2) or array of frequencies
+        :param fs: sample rate
+        :return: tuple(f, h) where h has shape (n, len(f))
+        """
+        if np.ndim(worN) == 0:
+            f = np.arange(worN) * (fs / 2.0 / worN)
+        else:
+            f = np.asarray(worN, dtype=np.float64)
+        z1 = np.exp(-2j * np.pi * f / fs)  # z**-1
+        z2 = z1 * z1
+        s = self.sos[:, :, np.newaxis]
+        h = (s[:, 0] + s[:, 1] * z1 + s[:, 2] * z2) / (s[:, 3] + s[:, 4] * z1 + s[:, 5] * z2)
+        return f, h
+
+    def response(self, worN=2048, fs=2.0):
+        """ Frequency response of the whole cascade.
+        :return: tuple(f, h)
+        """
+        f, h = self.sections_response(worN, fs)
+        return f, np.prod(h, axis=0)
+
+
+def as_cascade(bqs):
+    """ Convert biquad coefficients to a Cascade, no copy if already possible.
+    :param bqs: Cascade, array_like of shape (n, 6) or list of (b, a) tuples
+    :return: Cascade
+    """
+    if isinstance(bqs, Cascade):
+        return bqs
+    if isinstance(bqs, np.ndarray) and bqs.shape[-1] == 6:
+        return Cascade(bqs)
+    return Cascade.from_ba(bqs)
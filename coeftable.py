@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Table driven biquad design for real-time knob control.
+
+The exact designs of biquad.py are precomputed on a (frequency, gain, Q/S)
+grid, uniform in log prewarped frequency tan(pi * f / fs), dB gain and log
+Q/S. A design is then a trilinear interpolation of the 8 surrounding grid
+points, which costs a few array reads instead of a bilinear transform.
+
+The interpolation is done in a stable parameter domain. A polynomial
+[1, c1, c2] has its roots inside the unit circle if and only if
+    P = 1 + c1 + c2,  M = 1 - c1 + c2,  D = 2 * (1 - c2)
+are all positive (stability triangle), and P + M + D = 4 always holds.
+The table stores ln P, ln M, ln D of the denominator and of the numerator
+(normalized by b0, the designs are minimum phase) plus ln b0. Interpolated
+logs give positive P, M, D again, rescaled to a sum of 4 they are a stable
+(and minimum phase) biquad. The logs are also close to linear in the log
+prewarped frequency, which keeps the table small.
+
+The table is checked against the exact design at the midpoints of every
+cell: the edge midpoints, face centres and the cell centre, where the error
+of a trilinear interpolation peaks. The magnitude response is compared from
+10 Hz (or f0 / 2 if lower) to 0.49 * fs. The largest error found, times the
+safety factor ERROR_SAFETY, is the error bound `error_db`; `build` fails if
+it exceeds `max_error_db`. Random points within coarse tables stayed within
+3 % of the sampled maximum, the factor of 1.25 covers that with margin.
+Parameters outside the grid raise ValueError, the bound does not apply there.
+
+Tables are stored as .npy (memory-mappable) with a .json sidecar:
+
+    python3 coeftable.py build peaking --fs 48000 -o peaking48k
+    table = CoefTable.load('peaking48k')
+    sos = table.design(1000., 3.0, 1.4)
+"""
+
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+from math import exp, log10, pi, tan
+
+import numpy as np
+
+import biquad
+from cascade import Cascade
+
+FILTERS = {
+    # name: (design function of Wn, dBgain, x), name of the x axis
+    'peaking': (lambda wn, gain, q: biquad.peaking(wn, gain, Q=q, output='sos'), 'Q'),
+    'lowshelf': (lambda wn, gain, s: biquad.shelf(wn, gain, S=s, btype='low', output='sos'), 'S'),
+    'highshelf': (lambda wn, gain, s: biquad.shelf(wn, gain, S=s, btype='high', output='sos'), 'S'),
+}
+
+# default axes: (start, stop, number of points)
+AXES = {
+    'f': (20.0, 20e3, 61),
+    'gain': (-15.0, 15.0, 16),
+    'Q': (0.3, 10.0, 13),
+    'S': (0.1, 1.0, 7),
+}
+
+# number of designs per process pool job
+CHUNK = 2048
+
+
+# number of stored values per grid point
+WIDTH = 7
+
+# tolerance of the grid bounds, in cells
+_EPS = 1e-9
+
+# the error bound is the worst sampled error times ERROR_SAFETY, the error is
+# evaluated from ERROR_FMIN (or f0 / 2 if lower) to 0.49 * fs
+ERROR_SAFETY = 1.25
+ERROR_FMIN = 10.0
+
+
+def _triangle(c1, c2):
+    return np.log(1.0 + c1 + c2), np.log(1.0 - c1 + c2), np.log(2.0 * (1.0 - c2))
+
+
+def _from_triangle(lp, lm, ld):
+    p, m, d = np.exp(lp), np.exp(lm), np.exp(ld)
+    scale = 4.0 / (p + m + d)
+    return (p - m) * scale / 2.0, 1.0 - d * scale / 2.0
+
+
+def _to_stable(sos):
+    """ sos (n, 6) with a0 = 1 -> (n, 7): ln b0, triangle(b / b0), triangle(a) """
+    sos = np.asarray(sos).reshape(-1, 6)
+    b0 = sos[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = np.column_stack((np.log(b0),) + _triangle(sos[:, 1] / b0, sos[:, 2] / b0) + _triangle(sos[:, 4], sos[:, 5]))
+    if not np.all(np.isfinite(c)):
+        raise ValueError('biquad not stable or not minimum phase')
+    return c
+
+
+def _from_stable(c):
+    """ (n, 7) -> sos (n, 6) """
+    c = np.asarray(c).reshape(-1, WIDTH)
+    b0 = np.exp(c[:, 0])
+    b1, b2 = _from_triangle(c[:, 1], c[:, 2], c[:, 3])
+    a1, a2 = _from_triangle(c[:, 4], c[:, 5], c[:, 6])
+    return np.column_stack((b0, b1 * b0, b2 * b0, np.ones(len(c)), a1, a2))
+
+
+def _exact_chunk(job):
+    ftype, fs, f, gain, x = job
+    design = FILTERS[ftype][0]
+    return np.concatenate([design(2. * fi / fs, gi, xi) for fi, gi, xi in zip(f, gain, x)])
+
+
+def _exact(ftype, fs, f, gain, x, pool=None):
+    """ exact designs of biquad.py, spread over the process pool if given """
+    jobs = [(ftype, fs, f[i:i + CHUNK], gain[i:i + CHUNK], x[i:i + CHUNK]) for i in range(0, len(f), CHUNK)]
+    return np.concatenate(list((pool.map if pool else map)(_exact_chunk, jobs)))
+
+
+class CoefTable:
+    def __init__(self, table, meta):
+        """ c'tor, use `build` or `load`
+        :param table: array (nf, ng, nx, WIDTH) of stable coefficients
+        :param meta:  dict with 'type', 'fs', 'axes', 'error_db' and 'worst_point'
+        """
+        self.table = table
+        self.meta = meta
+        self.ftype = meta['type']
+        self.fs = meta['fs']
+        (f0, f1, nf), (g0, g1, ng), (x0, x1, nx) = meta['axes']
+        # axis coordinate: (log) value -> fractional index
+        self._f0, self._fstep, self._nf = self._warp(f0), (self._warp(f1) - self._warp(f0)) / (nf - 1), nf
+        self._g0, self._gstep, self._ng = g0, (g1 - g0) / (ng - 1), ng
+        self._x0, self._xstep, self._nx = log10(x0), (log10(x1) - log10(x0)) / (nx - 1), nx
+
+    def _warp(self, f):
+        """ frequency axis coordinate """
+        return log10(tan(pi * f / self.fs))
+
+    @staticmethod
+    def _frequencies(fs, start, stop, num):
+        """ frequency axis, uniform in log prewarped frequency """
+        k = np.geomspace(np.tan(np.pi * start / fs), np.tan(np.pi * stop / fs), num)
+        return fs / np.pi * np.arctan(k)
+
+    @property
+    def error_db(self):
+        """ bound of the magnitude response error against the exact design in dB """
+        return self.meta['error_db']
+
+    @staticmethod
+    def build(ftype, fs, f=AXES['f'], gain=AXES['gain'], x=None, max_error_db=None, worN=256, jobs=None):
+        """ Precompute a table.
+        :param ftype: 'peaking', 'lowshelf' or 'highshelf'
+        :param fs: sample rate in Hz
+        :param f, gain, x: axes (start, stop, points), x is Q resp. S
+        :param max_error_db: raise ValueError if the error bound exceeds it
+        :param worN: number of frequencies of the error evaluation
+        :param jobs: number of worker processes of the exact designs, default: number of CPUs
+        :return: CoefTable
+        """
+        if x is None:
+            x = AXES[FILTERS[ftype][1]]
+        if f[1] >= fs / 2:
+            raise ValueError('max. frequency {} Hz >= fs/2'.format(f[1]))
+
+        fa = CoefTable._frequencies(fs, *f)
+        ga = np.linspace(*gain)
+        xa = np.geomspace(*x)
+        F, G, X = np.meshgrid(fa, ga, xa, indexing='ij')
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            sos = _exact(ftype, fs, F.ravel(), G.ravel(), X.ravel(), pool)
+            table = _to_stable(sos).reshape(len(fa), len(ga), len(xa), WIDTH)
+
+            meta = {'type': ftype, 'fs': fs, 'axes': [list(f), list(gain), list(x)], 'error_db': None}
+            t = CoefTable(np.ascontiguousarray(table), meta)
+            sampled, meta['worst_point'] = t._sampled_error(worN, pool)
+            meta['error_db'] = ERROR_SAFETY * sampled
+        if max_error_db is not None and meta['error_db'] > max_error_db:
+            raise ValueError('interpolation error bound {:.3g} dB > {} dB, use a denser grid'.format(
+                meta['error_db'], max_error_db))
+        return t
+
+    def _sampled_error(self, worN, pool=None):
+        """ worst magnitude error at the midpoints of all cells: edge midpoints, face and cell centres
+        :return: tuple(error in dB, frequency, gain, x of the worst point)
+        """
+        (f0, f1, nf), (g0, g1, ng), (x0, x1, nx) = self.meta['axes']
+        # the grids refined by 2, odd indices are between the grid points
+        fa = CoefTable._frequencies(self.fs, f0, f1, 2 * nf - 1)
+        ga, xa = np.linspace(g0, g1, 2 * ng - 1), np.geomspace(x0, x1, 2 * nx - 1)
+        I, J, K = np.meshgrid(np.arange(len(fa)), np.arange(len(ga)), np.arange(len(xa)), indexing='ij')
+        between = ((I % 2) | (J % 2) | (K % 2)).ravel() == 1
+        F, G, X = fa[I.ravel()[between]], ga[J.ravel()[between]], xa[K.ravel()[between]]
+
+        freqs = np.geomspace(min(ERROR_FMIN, f0 / 2), 0.49 * self.fs, worN)
+        exact = _exact(self.ftype, self.fs, F, G, X, pool)
+        worst, where = 0.0, None
+        for i in range(0, len(F), CHUNK):
+            s = slice(i, i + CHUNK)
+            h_exact = Cascade(exact[s]).sections_response(freqs, self.fs)[1]
+            h_approx = Cascade(self.design_many(F[s], G[s], X[s])).sections_response(freqs, self.fs)[1]
+            err = np.max(np.abs(20 * np.log10(np.abs(h_approx) / np.abs(h_exact))), axis=1)
+            k = int(np.argmax(err))
+            if err[k] > worst:
+                worst, where = float(err[k]), (float(F[s][k]), float(G[s][k]), float(X[s][k]))
+        return worst, where
+
+    def _check(self, name, value, inside):
+        if not inside:
+            raise ValueError('{} {} outside the table {}'.format(name, value, self._axis(name)))
+
+    def _axis(self, name):
+        return self.meta['axes'][('f', 'gain', 'x').index(name)][:2]
+
+    def _index(self, v, v0, step, n):
+        p = (v - v0) / step
+        i = min(max(int(p), 0), n - 2)
+        return i, min(max(p - i, 0.0), 1.0), -_EPS <= p <= n - 1 + _EPS
+
+    def design(self, f, dBgain, x):
+        """ Interpolated design.
+        :param f: frequency in Hz
+        :param dBgain: gain in dB
+        :param x: Q (peaking) or S (shelves)
+        :return: sos array of shape (1, 6)
+        :raises ValueError: if a parameter is outside the table
+        """
+        if not 0 < f < self.fs / 2 or x <= 0:
+            raise ValueError('invalid parameters f={}, x={}'.format(f, x))
+        i, u, ok = self._index(self._warp(f), self._f0, self._fstep, self._nf)
+        self._check('f', f, ok)
+        j, v, ok = self._index(dBgain, self._g0, self._gstep, self._ng)
+        self._check('gain', dBgain, ok)
+        k, w, ok = self._index(log10(x), self._x0, self._xstep, self._nx)
+        self._check('x', x, ok)
+        c = self.table[i:i + 2, j:j + 2, k:k + 2]
+        c = c[0] + u * (c[1] - c[0])
+        c = c[0] + v * (c[1] - c[0])
+        c = c[0] + w * (c[1] - c[0])
+
+        # scalar back-conversion, cheaper than _from_stable() for a single biquad
+        lb0, bp, bm, bd, ap, am, ad = c.tolist()
+        b0 = exp(lb0)
+        bp, bm, bd, ap, am, ad = exp(bp), exp(bm), exp(bd), exp(ap), exp(am), exp(ad)
+        bs = 4.0 / (bp + bm + bd)
+        as_ = 4.0 / (ap + am + ad)
+        return np.array(((b0, b0 * (bp - bm) * bs / 2.0, b0 * (1.0 - bd * bs / 2.0),
+                          1.0, (ap - am) * as_ / 2.0, 1.0 - ad * as_ / 2.0),))
+
+    def design_many(self, f, dBgain, x):
+        """ Vectorized interpolated design.
+        :return: sos array of shape (n, 6)
+        :raises ValueError: if a parameter is outside the table
+        """
+        def index(name, value, v, v0, step, n):
+            p = (v - v0) / step
+            inside = (p >= -_EPS) & (p <= n - 1 + _EPS)
+            if not np.all(inside):
+                self._check(name, np.asarray(value)[~inside][0], False)
+            i = np.clip(p.astype(np.int64), 0, n - 2)
+            return i, np.clip(p - i, 0.0, 1.0)[:, np.newaxis]
+
+        f, dBgain, x = (np.asarray(a, dtype=np.float64) for a in (f, dBgain, x))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            i, u = index('f', f, np.log10(np.tan(np.pi * f / self.fs)), self._f0, self._fstep, self._nf)
+            j, v = index('gain', dBgain, dBgain, self._g0, self._gstep, self._ng)
+            k, w = index('x', x, np.log10(x), self._x0, self._xstep, self._nx)
+        t = self.table
+
+        def lerp_x(a, b):
+            return t[a, b, k] + w * (t[a, b, k + 1] - t[a, b, k])
+
+        def lerp_gx(a):
+            c0 = lerp_x(a, j)
+            return c0 + v * (lerp_x(a, j + 1) - c0)
+
+        c0 = lerp_gx(i)
+        return _from_stable(c0 + u * (lerp_gx(i + 1) - c0))
+
+    def save(self, path):
+        """ write `path`.npy and `path`.json """
+        np.save(path + '.npy', self.table)
+        with open(path + '.json', 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    @staticmethod
+    def load(path, mmap=True):
+        """ read a table written by `save`, memory-mapped by default """
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        table = np.load(path + '.npy', mmap_mode='r' if mmap else None)
+        # plain ndarray view of the mapping, slicing a np.memmap is noticeably slower
+        return CoefTable(table.view(np.ndarray), meta)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='build biquad coefficient tables')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    p = sub.add_parser('build', help='precompute a table')
+    p.add_argument('type', choices=sorted(FILTERS))
+    p.add_argument('--fs', type=float, default=48000.)
+    p.add_argument('--points', type=int, nargs=3, metavar=('F', 'GAIN', 'X'), default=None,
+                   help='number of grid points of the frequency, gain and Q/S axis')
+    p.add_argument('--max-error', type=float, default=None, help='max. interpolation error in dB')
+    p.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    p.add_argument('-o', '--output', required=True, help='output path without extension')
+    args = parser.parse_args(argv)
+
+    axes = [AXES['f'], AXES['gain'], AXES[FILTERS[args.type][1]]]
+    if args.points:
+        axes = [(a[0], a[1], n) for a, n in zip(axes, args.points)]
+    table = CoefTable.build(args.type, args.fs, *axes, max_error_db=args.max_error, jobs=args.jobs)
+    table.save(args.output)
+    print('{}: {} points, error bound {:.4f} dB'.format(args.output, table.table.shape[:3], table.error_db))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Linkwitz-Riley crossover design for multi-amp builds.
+
+An N-way crossover with the crossover frequencies f[0] < ... < f[N-2] is
+built as a tree, way i gets
+    HP(f[j]) for j < i,  LP(f[i]) (not for the top way),  AP(f[j]) for j > i
+The allpass sections align the phase of the lower ways with the crossovers
+above, so all ways sum up to an allpass (flat magnitude).
+
+Supported orders (per crossover) and their sections:
+    LR2:  LP/HP Q=1/2, HP with inverted polarity, 1st order allpass
+    LR4:  2x Butterworth Q=1/sqrt(2), allpass Q=1/sqrt(2)
+    LR8:  2x Butterworth 4th order (Q=0.54, 1.31), allpass with both Q's
+
+The design is vectorized: `freqs` may have any leading (sweep) dimensions,
+all designs and the summed responses are evaluated in one pass, e.g.
+
+    sos, counts = crossover.design(np.geomspace(1e3, 4e3, 200)[:, None], fs=48000)
+    deviation = crossover.max_deviation_db(sos, fs=48000)
+
+The coefficients are the closed form of the bilinear transform with
+prewarping, identical to biquad.lowpass/highpass/allpass.
+"""
+
+import argparse
+
+import numpy as np
+
+from cascade import Cascade, IDENTITY
+from tas5713 import TAS5713
+
+# Q's of the Butterworth sections of the LR halves
+_LR_Q = {
+    2: (0.5,),
+    4: (1 / np.sqrt(2),) * 2,
+    8: (1 / (2 * np.cos(np.pi / 8)), 1 / (2 * np.cos(3 * np.pi / 8))) * 2,
+}
+# Q's of the allpass sections, None: 1st order allpass
+_AP_Q = {
+    2: (None,),
+    4: (1 / np.sqrt(2),),
+    8: (1 / (2 * np.cos(np.pi / 8)), 1 / (2 * np.cos(3 * np.pi / 8))),
+}
+
+MAX_SECTIONS = len(TAS5713.CH1_BQ_reg)
+
+
+def _k(freqs, fs):
+    return np.tan(np.pi * np.asarray(freqs, dtype=np.float64) / fs)
+
+
+def lowpass(k, q):
+    """ vectorized biquad.lowpass, `k` = tan(pi * f / fs)
+    :return: sos array of shape k.shape + (6,)
+    """
+    k2 = k * k
+    a0 = 1 + k / q + k2
+    return np.stack(np.broadcast_arrays(k2 / a0, 2 * k2 / a0, k2 / a0,
+                                        1.0, 2 * (k2 - 1) / a0, (1 - k / q + k2) / a0), axis=-1)
+
+
+def highpass(k, q):
+    """ vectorized biquad.highpass """
+    k2 = k * k
+    a0 = 1 + k / q + k2
+    return np.stack(np.broadcast_arrays(1 / a0, -2 / a0, 1 / a0,
+                                        1.0, 2 * (k2 - 1) / a0, (1 - k / q + k2) / a0), axis=-1)
+
+
+def allpass(k, q):
+    """ vectorized biquad.allpass, 1st order allpass if `q` is None """
+    if q is None:
+        c = (k - 1) / (k + 1)
+        return np.stack(np.broadcast_arrays(c, 1.0, 0.0, 1.0, c, 0.0), axis=-1)
+    k2 = k * k
+    a0 = 1 + k / q + k2
+    a1, a2 = 2 * (k2 - 1) / a0, (1 - k / q + k2) / a0
+    return np.stack(np.broadcast_arrays(a2, a1, 1.0, 1.0, a1, a2), axis=-1)
+
+
+def _orders(order, n):
+    orders = (order,) * n if np.isscalar(order) else tuple(order)
+    if len(orders) != n:
+        raise ValueError('{} orders for {} crossovers'.format(len(orders), n))
+    for o in orders:
+        if o not in _LR_Q:
+            raise ValueError('unsupported Linkwitz-Riley order {}'.format(o))
+    return orders
+
+
+def section_counts(n_crossovers, order=4):
+    """ number of biquads of every way """
+    orders = _orders(order, n_crossovers)
+    counts = []
+    for i in range(n_crossovers + 1):
+        n = sum(len(_LR_Q[orders[j]]) for j in range(i))
+        if i < n_crossovers:
+            n += len(_LR_Q[orders[i]])
+        n += sum(len(_AP_Q[orders[j]]) for j in range(i + 1, n_crossovers))
+        counts.append(n)
+    return counts
+
+
+def design(freqs, fs, order=4):
+    """ Design the crossover(s).
+    :param freqs: crossover frequencies in Hz, shape (..., N-1) for N ways
+    :param fs: sample rate in Hz
+    :param order: Linkwitz-Riley order (2, 4, 8), scalar or one per crossover
+    :return: tuple(sos, counts), sos of shape (..., N, sections, 6) padded with
+             pass-through sections, counts: list of the number of biquads per way
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    if freqs.ndim == 0:
+        freqs = freqs[np.newaxis]
+    n = freqs.shape[-1]
+    orders = _orders(order, n)
+    if np.any(freqs <= 0) or np.any(freqs >= fs / 2):
+        raise ValueError('crossover frequencies must be within (0, fs/2)')
+    if n > 1 and np.any(np.diff(freqs, axis=-1) <= 0):
+        raise ValueError('crossover frequencies must be increasing')
+
+    counts = section_counts(n, orders)
+    for way, count in enumerate(counts):
+        if count > MAX_SECTIONS:
+            raise ValueError('way {} needs {} biquads, only {} available'.format(way, count, MAX_SECTIONS))
+
+    k = _k(freqs, fs)
+    lp, hp, ap = [], [], []
+    for j, o in enumerate(orders):
+        kj = k[..., j, np.newaxis]
+        lp.append(np.concatenate([lowpass(kj, q) for q in _LR_Q[o]], axis=-2))
+        h = np.concatenate([highpass(kj, q) for q in _LR_Q[o]], axis=-2)
+        if o == 2:
+            # LR2 sums flat with inverted polarity of the highpass
+            h[..., 0, :3] *= -1
+        hp.append(h)
+        ap.append(np.concatenate([allpass(kj, q) for q in _AP_Q[o]], axis=-2))
+
+    sections = max(counts)
+    sos = np.empty(freqs.shape[:-1] + (n + 1, sections, 6))
+    sos[...] = IDENTITY
+    for i in range(n + 1):
+        parts = hp[:i] + lp[i:i + 1] + ap[i + 1:]
+        sos[..., i, :counts[i], :] = np.concatenate(parts, axis=-2)
+    return sos, counts
+
+
+def ways_response(sos, fs, worN=512):
+    """ Response of every way, all sweeps at once.
+    :param sos: array of shape (..., ways, sections, 6) as returned by design()
+    :param fs: sample rate in Hz
+    :param worN: number of frequencies in [0, fs/2) or array of frequencies in Hz
+    :return: tuple(f, h), h of shape (..., ways, len(f))
+    """
+    shape = sos.shape[:-1]
+    f, h = Cascade(sos.reshape(-1, 6)).sections_response(worN, fs)
+    return f, np.prod(h.reshape(shape + (len(f),)), axis=-2)
+
+
+def summed_response(sos, fs, worN=512):
+    """ Sum of all ways (acoustic sum of ideal drivers at the same position).
+    :return: tuple(f, h), h of shape (..., len(f))
+    """
+    f, h = ways_response(sos, fs, worN)
+    return f, np.sum(h, axis=-2)
+
+
+def max_deviation_db(sos, fs, worN=512, fmin=20.0):
+    """ Worst deviation of the summed magnitude from 0 dB between `fmin` and 0.49 * fs.
+    :return: array of shape sos.shape[:-3]
+    """
+    if not 0 < fmin < 0.49 * fs:
+        raise ValueError('fmin {} Hz not below fs/2'.format(fmin))
+    f = np.geomspace(fmin, 0.49 * fs, worN)
+    _, h = summed_response(sos, fs, f)
+    return np.max(np.abs(20 * np.log10(np.abs(h))), axis=-1)
+
+
+def channels(freqs, fs, order=4):
+    """ Section lists of a single crossover design.
+    :return: list of Cascade, one per way
+    """
+    sos, counts = design(freqs, fs, order)
+    return [Cascade(sos[i, :n]) for i, n in enumerate(counts)]
+
+
+def reg_value(freqs, fs, order=4):
+    """ Register values of a 2-way crossover, CH1: low, CH2: high """
+    freqs = np.atleast_1d(freqs)
+    if len(freqs) != 1:
+        raise ValueError('the TAS5713 has two channels, only 2-way crossovers can be programmed')
+    low, high = channels(freqs, fs, order)
+    return TAS5713.bq_reg_value(low, high)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='sweep Linkwitz-Riley crossover frequencies')
+    parser.add_argument('start', type=float, help='first crossover frequency in Hz')
+    parser.add_argument('stop', type=float, help='last crossover frequency in Hz')
+    parser.add_argument('-n', type=int, default=50, help='number of frequencies')
+    parser.add_argument('--order', type=int, default=4, choices=sorted(_LR_Q))
+    parser.add_argument('--fs', type=float, default=46000.)
+    args = parser.parse_args(argv)
+
+    freqs = np.geomspace(args.start, args.stop, args.n)[:, np.newaxis]
+    sos, counts = design(freqs, args.fs, args.order)
+    deviation = max_deviation_db(sos, fs=args.fs)
+    print('biquads per way: {}'.format(counts))
+    for f, d in zip(freqs[:, 0], deviation):
+        print('{:8.1f} Hz: max. deviation {:.4f} dB'.format(f, d))
+
+
+if __name__ == "__main__":
+    main()
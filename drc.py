@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dynamic range control (DRC) design for the TAS5713.
+
+The DRC of the amp estimates the signal energy with a first order filter
+(time constant `energy`), compares it with the threshold and applies the
+compression slope above it. The gain reduction follows with the `attack`
+and `decay` time constants. DRC1 acts on CH1/CH2, DRC2 on CH4.
+
+    regvals = drc.reg_value(DRC(threshold=-6.0, ratio=float('inf'), fs=48000))
+
+The register values are meant for the same bulk write path as the biquads
+(TAS5713.bq_reg_value, register images of preset.py).
+
+Coding of the values:
+  alpha (ae, aa, ad)    1 - exp(-1 / (tau * fs)), written with 1 - alpha, 3.23
+  threshold T           threshold in log2 units (dB / 6.02), signed 9.23;
+                        the reset value 0xFDA21490 is the default of -28.5 dB
+  slope K               1/ratio - 1 (-1: limiter, 0: no compression), 3.23
+  offset O              gain offset in log2 units, 3.23
+"""
+
+from math import exp, log10
+
+from tas5713 import TAS5713, fixpoint, COEF_3_23_MASK, COEF_9_23_MASK
+
+# 20 * log10(2), dB per log2 unit
+DB_PER_LOG2 = 20 * log10(2)
+# default threshold and its reset register value
+DEFAULT_THRESHOLD_DB = -28.5
+RESET_T = 0xFDA21490
+
+_REGS = {
+    1: (TAS5713.DRC1_AE_reg, TAS5713.DRC1_AA_reg, TAS5713.DRC1_AD_reg,
+        TAS5713.DRC1_T_reg, TAS5713.DRC1_K_reg, TAS5713.DRC1_O_reg),
+    2: (TAS5713.DRC2_AE_reg, TAS5713.DRC2_AA_reg, TAS5713.DRC2_AD_reg,
+        TAS5713.DRC2_T_reg, TAS5713.DRC2_K_reg, TAS5713.DRC2_O_reg),
+}
+
+
+class DRC:
+    def __init__(self, threshold=-6.0, ratio=float('inf'), attack=0.001, decay=0.1, energy=0.005,
+                 offset=0.0, fs=48000):
+        """ c'tor
+        :param threshold: threshold in dBFS
+        :param ratio:     compression ratio above the threshold, inf for a limiter
+        :param attack:    attack time constant in s
+        :param decay:     decay (release) time constant in s
+        :param energy:    time constant of the energy estimation in s
+        :param offset:    gain offset in dB
+        :param fs:        sample rate in Hz
+        """
+        if ratio < 1:
+            raise ValueError('compression ratio {} < 1'.format(ratio))
+        for name, tau in (('attack', attack), ('decay', decay), ('energy', energy)):
+            if tau <= 0:
+                raise ValueError('{} time constant must be > 0'.format(name))
+        if not -256 <= threshold / DB_PER_LOG2 < 256:
+            raise ValueError('threshold {} dB out of range'.format(threshold))
+        if not -4 <= offset / DB_PER_LOG2 < 4:
+            raise ValueError('offset {} dB out of range'.format(offset))
+
+        self.threshold = threshold
+        self.ratio = ratio
+        self.attack = attack
+        self.decay = decay
+        self.energy = energy
+        self.offset = offset
+        self.fs = fs
+
+    def alpha(self, tau):
+        """ coefficient of a first order filter with time constant `tau` """
+        return 1.0 - exp(-1.0 / (tau * self.fs))
+
+    def coefficients(self):
+        """ :return: dict of the DRC coefficients as float """
+        return {
+            'ae': self.alpha(self.energy),
+            'aa': self.alpha(self.attack),
+            'ad': self.alpha(self.decay),
+            'T': self.threshold / DB_PER_LOG2,
+            'K': 1.0 / self.ratio - 1.0,
+            'O': self.offset / DB_PER_LOG2,
+        }
+
+    def reg_value(self, drc=1):
+        """ Register values of the DRC coefficients (without the control register)
+        :param drc: 1: DRC1 (CH1/CH2), 2: DRC2 (CH4)
+        :return: list[tuple(Reg, bytes),...]
+        """
+        c = self.coefficients()
+        ae_reg, aa_reg, ad_reg, t_reg, k_reg, o_reg = _REGS[drc]
+        return [
+            (ae_reg, fixpoint((c['ae'], 1.0 - c['ae']))),
+            (aa_reg, fixpoint((c['aa'], 1.0 - c['aa']))),
+            (ad_reg, fixpoint((c['ad'], 1.0 - c['ad']))),
+            (t_reg, fixpoint((c['T'],), COEF_9_23_MASK)),
+            (k_reg, fixpoint((c['K'],), COEF_3_23_MASK)),
+            (o_reg, fixpoint((c['O'],), COEF_3_23_MASK)),
+        ]
+
+
+def reg_value(drc1=None, drc2=None):
+    """ Register values of both DRCs including the control register, which is
+        written last so the DRCs are enabled with valid coefficients only.
+    :param drc1: DRC for CH1/CH2 or None (disabled)
+    :param drc2: DRC for CH4 or None (disabled)
+    :return: list[tuple(Reg, bytes),...]
+    """
+    regvals = []
+    ctrl = 0
+    for bit, drc in enumerate((drc1, drc2)):
+        if drc is not None:
+            regvals += drc.reg_value(bit + 1)
+            ctrl |= 1 << bit
+    regvals.append((TAS5713.DRC_CTRL_reg, ctrl.to_bytes(4, 'big')))
+    return regvals
+
+
+if __name__ == "__main__":
+    # the encoded default threshold has to give the reset value of the register
+    t_reg, t_data = DRC(threshold=DEFAULT_THRESHOLD_DB).reg_value()[3]
+    assert t_reg is TAS5713.DRC1_T_reg
+    assert t_data == RESET_T.to_bytes(4, 'big'), t_data.hex()
+    print('DRC T reset value ok')
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timing instrumentation of the programming pipeline.
+
+Records the duration of pipeline phases, a latency histogram of the single
+I2C transactions and retry counters. The result is available as JSON or as
+Prometheus textfile (for node_exporter's textfile collector).
+"""
+
+import cProfile
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# upper bounds of the I2C latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5, float('inf'))
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def as_dict(self):
+        return OrderedDict((
+            ('count', self.count),
+            ('sum', self.sum),
+            ('max', self.max),
+            ('buckets', OrderedDict(('{:g}'.format(b), c) for b, c in zip(self.buckets, self.counts))),
+        ))
+
+
+class Metrics:
+    def __init__(self, prefix='tas5713eq'):
+        self.prefix = prefix
+        self.phases = OrderedDict()        # phase -> accumulated seconds
+        self.transactions = OrderedDict()  # kind -> Histogram
+        self.retries = OrderedDict()       # name -> count
+        self.start = time.time()
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """ measure a pipeline phase, repeated phases are accumulated """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - t0)
+
+    @contextmanager
+    def transaction(self, kind):
+        """ measure a single bus transaction, e.g. 'read' or 'write' """
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.transactions.setdefault(kind, Histogram()).observe(time.perf_counter() - t0)
+
+    def retry(self, name):
+        self.retries[name] = self.retries.get(name, 0) + 1
+
+    def as_dict(self):
+        return OrderedDict((
+            ('start', self.start),
+            ('phases', self.phases),
+            ('transactions', OrderedDict((k, h.as_dict()) for k, h in self.transactions.items())),
+            ('retries', self.retries),
+        ))
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2)
+
+    def prometheus(self):
+        """ :return: metrics in Prometheus text exposition format """
+        p = self.prefix
+        lines = [
+            '# HELP {}_phase_seconds Duration of the programming pipeline phases.'.format(p),
+            '# TYPE {}_phase_seconds gauge'.format(p),
+        ]
+        for name, seconds in self.phases.items():
+            lines.append('{}_phase_seconds{{phase="{}"}} {:.6f}'.format(p, name, seconds))
+
+        lines += [
+            '# HELP {}_i2c_latency_seconds Latency of the I2C transactions.'.format(p),
+            '# TYPE {}_i2c_latency_seconds histogram'.format(p),
+        ]
+        for kind, h in self.transactions.items():
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else '{:g}'.format(bound)
+                lines.append('{}_i2c_latency_seconds_bucket{{kind="{}",le="{}"}} {}'.format(p, kind, le, cumulative))
+            lines.append('{}_i2c_latency_seconds_sum{{kind="{}"}} {:.6f}'.format(p, kind, h.sum))
+            lines.append('{}_i2c_latency_seconds_count{{kind="{}"}} {}'.format(p, kind, h.count))
+
+        lines += [
+            '# HELP {}_retries_total Number of retries.'.format(p),
+            '# TYPE {}_retries_total counter'.format(p),
+        ]
+        for name, count in self.retries.items():
+            lines.append('{}_retries_total{{operation="{}"}} {}'.format(p, name, count))
+
+        lines += [
+            '# HELP {}_last_run_timestamp_seconds Start time of the last run.'.format(p),
+            '# TYPE {}_last_run_timestamp_seconds gauge'.format(p),
+            '{}_last_run_timestamp_seconds {:.3f}'.format(p, self.start),
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        """ :param path: file name or '-' for stdout """
+        if path == '-':
+            print(self.to_json())
+        else:
+            with open(path, 'w') as f:
+                f.write(self.to_json())
+
+    def write_prometheus(self, path):
+        """ write the textfile atomically, the collector must never see a partial file """
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+
+@contextmanager
+def profiled(path):
+    """ Run the block under cProfile and dump the stats to `path` (no-op if path is empty).
+        Inspect with: python3 -m pstats <path>
+    """
+    if not path:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Write-ahead journal of a register programming run.
+
+Before the first register is written, the target image and the previous
+complete register bank are stored in the journal. Every verified register
+appends a progress record. A run which is killed halfway leaves the journal
+behind, so the next run can resume (or roll back) instead of starting over
+with the amp holding a mixed cascade.
+
+File layout (text, append only):
+    line 1:   JSON header {"target": [[addr, hex], ...], "previous": [[addr, hex], ...]}
+    line 2..: "ok <index>" for every verified register of the target
+A partially written last line is ignored.
+"""
+
+import json
+import os
+
+from tas5713 import TAS5713
+
+
+def _encode(regvals):
+    return [[reg.addr, bytes(data).hex()] for reg, data in regvals]
+
+
+def _decode(items):
+    return [(TAS5713.reg_by_addr(addr), bytes.fromhex(data)) for addr, data in items]
+
+
+def _fsync_dir(path):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.bank_path = path + '.bank'  # image of the last completely programmed bank
+        self._file = None
+
+    def pending(self):
+        """ Read the journal of an unfinished run.
+        :return: tuple(target, previous, verified) or None, `verified` is the
+                 number of registers verified in order
+        """
+        try:
+            with open(self.path) as f:
+                lines = f.read().split('\n')
+        except FileNotFoundError:
+            return None
+
+        try:
+            header = json.loads(lines[0])
+            target, previous = _decode(header['target']), _decode(header['previous'])
+        except (ValueError, KeyError):
+            # the header is written atomically, a broken one is no journal of ours
+            return None
+
+        verified = 0
+        # the last element is either empty (complete line) or a partial record
+        for line in lines[1:-1]:
+            if line != 'ok {}'.format(verified):
+                break
+            verified += 1
+        return target, previous, verified
+
+    def last_bank(self):
+        """ :return: register values of the last completely programmed bank or None """
+        try:
+            return TAS5713.load_image(self.bank_path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def begin(self, target, previous, verified=0):
+        """ Start (or continue) a run, the header is written atomically. """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(json.dumps({'target': _encode(target), 'previous': _encode(previous)}) + '\n')
+            for i in range(verified):
+                f.write('ok {}\n'.format(i))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        _fsync_dir(self.path)
+        self._file = open(self.path, 'a')
+
+    def verified(self, index):
+        """ Record register `index` of the target as written and verified. """
+        self._file.write('ok {}\n'.format(index))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def commit(self, target):
+        """ The whole target is programmed: it becomes the last bank, the journal is dropped. """
+        self.close()
+        tmp = self.bank_path + '.tmp'
+        TAS5713.save_image(tmp, target)
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, self.bank_path)
+        os.remove(self.path)
+        _fsync_dir(self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
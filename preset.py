@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Declarative equalizer presets.
+
+A preset library is a JSON (or TOML) file with a table of presets:
+
+    {
+      "bass-treble": {
+        "fs": 46000,
+        "bands": [
+          {"filter": "shelf", "f": 125, "dBgain": 5.0, "S": 1, "btype": "low"},
+          {"filter": "shelf", "f": 8e3, "dBgain": 1.5, "S": 0.7, "btype": "high"}
+        ]
+      },
+      "biamp": {
+        "fs": [44100, 48000],
+        "channels": {
+          "ch1": [{"filter": "lowpass", "f": 2000, "Q": 0.5}],
+          "ch2": [{"filter": "highpass", "f": 2000, "Q": 0.5}]
+        }
+      }
+    }
+
+`bands` applies to both channels, `channels` maps CH1/CH2 separately.
+`filter` names a function of biquad.py, `f` is the frequency in Hz and all
+the other keys are passed as keyword arguments (e.g. `Q`, `dBgain`, `type`).
+Additionally `iirfilter` (scipy.signal.iirfilter, frequencies in Hz) and
+`gain` (`dBgain` of a flat stage) are available.
+
+An optional `drc` table configures the dynamic range control of CH1/CH2
+(keyword arguments of drc.DRC, e.g. {"threshold": -6, "ratio": 4}), a
+`drc2` table the one of CH4. Without them the DRC registers are not written.
+
+`python3 preset.py compile presets/*.json -o images/` validates and designs
+every preset of the libraries in parallel and emits one register image per
+preset and sample rate, ready to be written by tas5713eq.py without any
+filter design at runtime.
+"""
+
+import argparse
+import inspect
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import signal
+
+import biquad
+import drc
+from cascade import Cascade
+from tas5713 import TAS5713
+
+FILTERS = {
+    'lowpass': biquad.lowpass,
+    'highpass': biquad.highpass,
+    'bandpass': biquad.bandpass,
+    'notch': biquad.notch,
+    'allpass': biquad.allpass,
+    'peaking': biquad.peaking,
+    'shelf': biquad.shelf,
+}
+
+CHANNELS = ('ch1', 'ch2')
+
+# biquad coefficients are stored as 3.23 fixpoint in 26 bits
+COEF_LIMIT = 4.0
+
+
+class PresetError(ValueError):
+    pass
+
+
+def load_library(path):
+    """ Load a preset library file.
+    :param path: .json or .toml file
+    :return: dict name -> preset
+    """
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+            with open(path, 'rb') as f:
+                return tomllib.load(f)
+        except ImportError:
+            import toml
+            return toml.load(path)
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def _sample_rates(name, preset):
+    fs = preset.get('fs')
+    if fs is None:
+        raise PresetError('{}: missing sample rate "fs"'.format(name))
+    return list(fs) if isinstance(fs, (list, tuple)) else [fs]
+
+
+def _channel_bands(name, preset):
+    if 'channels' in preset:
+        channels = preset['channels']
+        unknown = set(channels) - set(CHANNELS)
+        if unknown:
+            raise PresetError('{}: unknown channel(s) {}'.format(name, ', '.join(sorted(unknown))))
+        return [channels.get(ch, []) for ch in CHANNELS]
+    if 'bands' in preset:
+        return [preset['bands']] * len(CHANNELS)
+    raise PresetError('{}: neither "bands" nor "channels" defined'.format(name))
+
+
+def design_band(band, fs):
+    """ Calculate the biquad(s) of a single band definition.
+    :param band: dict, band definition
+    :param fs: sample rate in Hz
+    :return: sos array of shape (n, 6)
+    """
+    kwargs = dict(band)
+    ftype = kwargs.pop('filter', None)
+
+    if ftype == 'gain':
+        return np.array([(10.0**(kwargs.pop('dBgain') / 20.0), 0., 0., 1., 0., 0.)])
+
+    if ftype == 'iirfilter':
+        kwargs['Wn'] = kwargs.pop('f')
+        return signal.iirfilter(output='sos', fs=fs, **kwargs)
+
+    if ftype not in FILTERS:
+        raise PresetError('unknown filter "{}"'.format(ftype))
+
+    func = FILTERS[ftype]
+    f = kwargs.pop('f')
+    if not 0 < f < fs / 2:
+        raise PresetError('{} frequency {} Hz out of range (0, {})'.format(ftype, f, fs / 2))
+    try:
+        inspect.signature(func).bind(2. * f / fs, output='sos', **kwargs)
+    except TypeError as e:
+        raise PresetError('{}: {}'.format(ftype, e))
+
+    return func(2. * f / fs, output='sos', **kwargs)
+
+
+def design(name, preset, fs):
+    """ Design all biquads of a preset.
+    :return: tuple(ch1 Cascade, ch2 Cascade)
+    """
+    channels = []
+    for ch, bands in zip(CHANNELS, _channel_bands(name, preset)):
+        sections = [np.empty((0, 6))]
+        for i, band in enumerate(bands):
+            try:
+                sections.append(design_band(band, fs))
+            except (PresetError, KeyError, TypeError, ValueError) as e:
+                raise PresetError('{} @ {} Hz, {} band {}: {}'.format(name, fs, ch, i, e))
+        channels.append(Cascade.concatenate(*sections))
+    return tuple(channels)
+
+
+def validate(name, fs, channels):
+    """ Check that the designed biquads fit into the amplifier. """
+    for ch, bqs in zip(CHANNELS, channels):
+        if len(bqs) > len(TAS5713.CH1_BQ_reg):
+            raise PresetError('{} @ {} Hz, {}: {} biquads, only {} available'.format(
+                name, fs, ch, len(bqs), len(TAS5713.CH1_BQ_reg)))
+        for i in np.flatnonzero(np.any(np.abs(bqs.sos) >= COEF_LIMIT, axis=1)):
+            raise PresetError('{} @ {} Hz, {} biquad {}: coefficient overflow {}'.format(
+                name, fs, ch, i, bqs.sos[i]))
+        for i in np.flatnonzero(~bqs.is_stable()):
+            raise PresetError('{} @ {} Hz, {} biquad {}: unstable'.format(name, fs, ch, i))
+
+
+def compile_preset(job):
+    """ Design, validate and convert a preset to register values (process pool worker).
+    :param job: tuple(name, preset, fs)
+    :return: tuple(name, fs, regvals)
+    """
+    name, preset, fs = job
+    channels = design(name, preset, fs)
+    validate(name, fs, channels)
+    regvals = TAS5713.bq_reg_value(*channels)
+    if 'drc' in preset or 'drc2' in preset:
+        regvals += design_drc(name, preset, fs)
+    return name, fs, regvals
+
+
+def design_drc(name, preset, fs):
+    """ :return: register values of the dynamic range control """
+    drcs = []
+    for key in ('drc', 'drc2'):
+        if key not in preset:
+            drcs.append(None)
+            continue
+        try:
+            drcs.append(drc.DRC(fs=fs, **preset[key]))
+        except (TypeError, ValueError) as e:
+            raise PresetError('{} @ {} Hz, {}: {}'.format(name, fs, key, e))
+    return drc.reg_value(*drcs)
+
+
+def image_name(name, fs, multi_fs):
+    return '{}@{:g}.img'.format(name, fs) if multi_fs else '{}.img'.format(name)
+
+
+def compile_libraries(paths, outdir, jobs=None):
+    """ Compile all presets of the given libraries into register images.
+    :param paths: list of library files
+    :param outdir: output directory
+    :param jobs: number of worker processes, default: number of CPUs
+    :return: list of written image files
+    """
+    work = []
+    multi_fs = {}
+    for path in paths:
+        for name, preset in load_library(path).items():
+            if name in multi_fs:
+                raise PresetError('{}: preset "{}" defined twice'.format(path, name))
+            rates = _sample_rates(name, preset)
+            multi_fs[name] = len(rates) > 1
+            work += [(name, preset, fs) for fs in rates]
+
+    os.makedirs(outdir, exist_ok=True)
+    written = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for name, fs, regvals in pool.map(compile_preset, work):
+            path = os.path.join(outdir, image_name(name, fs, multi_fs[name]))
+            TAS5713.save_image(path, regvals)
+            written.append(path)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='TAS5713 equalizer preset tool')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('compile', help='compile preset libraries into register images')
+    p.add_argument('library', nargs='+', help='preset library (.json, .toml)')
+    p.add_argument('-o', '--outdir', default='images', help='output directory')
+    p.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+
+    p = sub.add_parser('list', help='list presets of libraries')
+    p.add_argument('library', nargs='+', help='preset library (.json, .toml)')
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'compile':
+            for path in compile_libraries(args.library, args.outdir, args.jobs):
+                print(path)
+        elif args.command == 'list':
+            for path in args.library:
+                for name, preset in load_library(path).items():
+                    print('{}: {} ({} Hz)'.format(path, name, ', '.join(
+                        '{:g}'.format(fs) for fs in _sample_rates(name, preset))))
+    except PresetError as e:
+        print('error: {}'.format(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Nearest-preset search over a library of compiled register images.
+
+Every preset is reduced to a compact feature vector: the magnitude response
+in dB of its (quantized) biquads at the 1/3 octave centre frequencies from
+20 Hz to 20 kHz. A k-d tree over these vectors answers "which preset is
+closest to this curve" without evaluating all the presets.
+
+New presets are collected in a small buffer, which is searched brute-force
+together with the tree; the tree is rebuilt only when the buffer grows
+beyond a fraction of the indexed presets. The buffer is saved to its own
+file, so adding presets to a saved index does not rewrite the indexed part.
+
+The features need the whole 20 Hz ... 20 kHz range, sample rates below
+2 * FEATURE_FREQS[-1] (40.3 kHz) are rejected.
+
+    python3 presetindex.py build images/ -o presets.idx --fs 46000
+    python3 presetindex.py add presets.idx images/new.img --fs 46000
+    python3 presetindex.py query presets.idx measurement.csv -k 5
+
+The query curve is a CSV file of frequency [Hz], level [dB] rows. To find the
+preset which compensates a measured response, query with `--invert`.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from cascade import Cascade
+from tas5713 import TAS5713, BQReg
+
+# 1/3 octave centre frequencies, 20 Hz ... 20 kHz
+FEATURE_FREQS = 1000. * 2. ** (np.arange(-17, 14) / 3.)
+
+# rebuild the tree when the buffer exceeds this fraction of the indexed presets
+REBUILD_RATIO = 0.1
+REBUILD_MIN = 64
+
+
+def image_sos(regvals, channel='ch1'):
+    """ biquads of a channel of a register image
+    :return: sos array of shape (n, 6)
+    """
+    regs = TAS5713.CH1_BQ_reg if channel == 'ch1' else TAS5713.CH2_BQ_reg
+    data = dict((reg.addr, bytes(d)) for reg, d in regvals)
+    return BQReg.reg_to_sos(b''.join(data[reg.addr] for reg in regs))
+
+
+def features(sos, fs, normalize=True):
+    """ feature vector of a biquad cascade
+    :param normalize: remove the mean level, compare the shape only
+    :return: float32 array of len(FEATURE_FREQS)
+    """
+    if FEATURE_FREQS[-1] >= fs / 2:
+        raise ValueError('sample rate {} Hz too low, the features need {:.0f} Hz'.format(fs, FEATURE_FREQS[-1]))
+    _, h = Cascade(sos).response(FEATURE_FREQS, fs)
+    db = 20 * np.log10(np.maximum(np.abs(h), 1e-6))
+    return _normalized(db, normalize)
+
+
+def curve_features(freqs, db, normalize=True):
+    """ feature vector of a measured curve, interpolated in log frequency """
+    order = np.argsort(freqs)
+    freqs, db = np.asarray(freqs, dtype=np.float64)[order], np.asarray(db, dtype=np.float64)[order]
+    return _normalized(np.interp(np.log(FEATURE_FREQS), np.log(freqs), db), normalize)
+
+
+def _normalized(db, normalize):
+    if normalize:
+        db = db - np.mean(db)
+    return db.astype(np.float32)
+
+
+class PresetIndex:
+    def __init__(self, normalize=True):
+        self.normalize = normalize
+        self.names = []
+        self._indexed = np.empty((0, len(FEATURE_FREQS)), dtype=np.float32)
+        self._pending = []
+        self._tree = None
+        self._saved = (None, 0)  # path and number of indexed presets of the last written .npy
+
+    def __len__(self):
+        return len(self._indexed) + len(self._pending)
+
+    def add(self, name, sos, fs):
+        """ add a preset given by its biquads """
+        self.names.append(name)
+        self._pending.append(features(sos, fs, self.normalize))
+        if len(self._pending) > max(REBUILD_MIN, REBUILD_RATIO * len(self._indexed)):
+            self.rebuild()
+
+    def add_image(self, path, fs, channel='ch1'):
+        """ add a compiled register image, the name is the file name without extension """
+        name = os.path.splitext(os.path.basename(path))[0]
+        self.add(name, image_sos(TAS5713.load_image(path), channel), fs)
+
+    def rebuild(self):
+        if self._pending:
+            self._indexed = np.concatenate((self._indexed, np.array(self._pending)))
+            self._pending = []
+        self._tree = cKDTree(self._indexed) if len(self._indexed) else None
+
+    def query(self, freqs, db, k=1):
+        """ presets closest to a curve
+        :param freqs: frequencies of the curve in Hz
+        :param db: levels of the curve in dB
+        :param k: number of presets
+        :return: list of tuple(name, RMS difference in dB), closest first
+        """
+        x = curve_features(freqs, db, self.normalize)
+        found = []
+        if self._tree is not None:
+            dist, idx = self._tree.query(x, k=min(k, len(self._indexed)))
+            found += zip(np.atleast_1d(dist), np.atleast_1d(idx))
+        if self._pending:
+            dist = np.linalg.norm(np.array(self._pending) - x, axis=1)
+            found += zip(dist, len(self._indexed) + np.arange(len(dist)))
+        found.sort()
+        scale = 1. / np.sqrt(len(x))
+        return [(self.names[i], float(d * scale)) for d, i in found[:k]]
+
+    def save(self, path):
+        """ write `path`.npy (indexed presets, only if changed), `path`.pending.npy and `path`.json """
+        saved = (os.path.abspath(path), len(self._indexed))
+        if self._saved != saved or not os.path.exists(path + '.npy'):
+            np.save(path + '.npy', self._indexed)
+            self._saved = saved
+        np.save(path + '.pending.npy', np.array(self._pending, dtype=np.float32).reshape(-1, len(FEATURE_FREQS)))
+        with open(path + '.json', 'w') as f:
+            json.dump({'normalize': self.normalize, 'names': self.names}, f)
+
+    @staticmethod
+    def load(path):
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        index = PresetIndex(meta['normalize'])
+        index.names = meta['names']
+        index._indexed = np.load(path + '.npy')
+        index._saved = (os.path.abspath(path), len(index._indexed))
+        if os.path.exists(path + '.pending.npy'):
+            index._pending = list(np.load(path + '.pending.npy'))
+        index._tree = cKDTree(index._indexed) if len(index._indexed) else None
+        return index
+
+
+def _image_fs(path, fs):
+    """ sample rate from the image name (name@fs.img) or the default """
+    m = re.search(r'@([0-9.]+)\.img$', path)
+    if m:
+        return float(m.group(1))
+    if fs is None:
+        raise ValueError('{}: sample rate unknown, use --fs'.format(path))
+    return fs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='nearest preset search')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('build', help='index all images of a directory')
+    p.add_argument('images', help='directory of register images')
+    p.add_argument('-o', '--output', required=True, help='index path without extension')
+    p.add_argument('--fs', type=float, default=None, help='sample rate of images without @fs in their name')
+    p.add_argument('--channel', choices=('ch1', 'ch2'), default='ch1')
+    p.add_argument('--absolute', action='store_true', help='compare absolute levels, not only the shape')
+
+    p = sub.add_parser('add', help='add images to an index')
+    p.add_argument('index', help='index path without extension')
+    p.add_argument('image', nargs='+')
+    p.add_argument('--fs', type=float, default=None)
+    p.add_argument('--channel', choices=('ch1', 'ch2'), default='ch1')
+
+    p = sub.add_parser('query', help='find the presets closest to a curve')
+    p.add_argument('index', help='index path without extension')
+    p.add_argument('curve', help='CSV file: frequency [Hz], level [dB]')
+    p.add_argument('-k', type=int, default=1, help='number of presets')
+    p.add_argument('--invert', action='store_true', help='search the preset compensating the curve')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        index = PresetIndex(normalize=not args.absolute)
+        for path in sorted(glob.glob(os.path.join(args.images, '*.img'))):
+            index.add_image(path, _image_fs(path, args.fs), args.channel)
+        index.save(args.output)
+        print('{}: {} presets'.format(args.output, len(index)))
+    elif args.command == 'add':
+        index = PresetIndex.load(args.index)
+        for path in args.image:
+            index.add_image(path, _image_fs(path, args.fs), args.channel)
+        index.save(args.index)
+        print('{}: {} presets'.format(args.index, len(index)))
+    elif args.command == 'query':
+        index = PresetIndex.load(args.index)
+        curve = np.loadtxt(args.curve, delimiter=',', ndmin=2)
+        db = -curve[:, 1] if args.invert else curve[:, 1]
+        for name, rms in index.query(curve[:, 0], db, args.k):
+            print('{}: {:.2f} dB RMS'.format(name, rms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Interactive equalizer previewer.
+
+usage: previewer.py library preset [--fs FS] [--channel ch1|ch2] [--live]
+
+Every band of the preset gets sliders for its frequency, gain, Q and slope.
+Moving a slider recalculates only the response of that band, updates the
+cached total response and redraws the curves by blitting. With `--live`
+the changed biquad registers are written to the TAS5713 as well (debounced,
+only registers whose value differs from the last write).
+When the window is closed the tuned bands are printed as JSON, ready to be
+pasted into the preset library.
+"""
+
+import argparse
+import json
+import threading
+
+import numpy as np
+
+import preset
+from cascade import Cascade
+
+# slider ranges of the band parameters
+RANGES = {
+    'f': (20.0, 20e3),
+    'dBgain': (-15.0, 15.0),
+    'Q': (0.1, 10.0),
+    'S': (0.1, 1.0),
+}
+
+
+class BandEditor:
+    """ Holds the bands of a channel and their cached frequency responses. """
+
+    def __init__(self, bands, fs, worN=1024):
+        self.bands = [dict(b) for b in bands]
+        self.fs = fs
+        self.f = np.geomspace(RANGES['f'][0], fs / 2, worN, endpoint=False)
+        self.sos = [preset.design_band(b, fs) for b in self.bands]
+        self.h = np.array([self._response(sos) for sos in self.sos]).reshape(-1, worN)
+        self.total = np.prod(self.h, axis=0)
+
+    def _response(self, sos):
+        return Cascade(sos).response(self.f, self.fs)[1]
+
+    def set_param(self, k, key, value):
+        """ Change a parameter of band `k`, recalculates band `k` only.
+        :return: response of band `k`
+        """
+        band = dict(self.bands[k])
+        band[key] = value
+        sos = preset.design_band(band, self.fs)
+        h = self._response(sos)
+
+        h_old = self.h[k]
+        if np.min(np.abs(h_old)) > 1e-6:
+            # replace the band's contribution in the cached product
+            self.total *= h / h_old
+            self.h[k] = h
+        else:
+            # zeros (e.g. notch) can not be divided out
+            self.h[k] = h
+            self.total = np.prod(self.h, axis=0)
+
+        self.bands[k], self.sos[k] = band, sos
+        return h
+
+    def cascade(self):
+        return Cascade.concatenate(np.empty((0, 6)), *self.sos)
+
+
+class DebouncedWriter:
+    """ Writes register values to the amplifier after `delay` seconds of
+        silence, only registers which differ from the last written value. """
+
+    def __init__(self, amp, delay=0.15):
+        self.amp = amp
+        self.delay = delay
+        self.written = {}  # sub-address -> bytes
+        self._target = None
+        self._timer = None
+        self._closed = False
+        self._lock = threading.Lock()
+        # held for a whole flush, only one thread writes to the bus at a time
+        self._write_lock = threading.Lock()
+
+    def update(self, regvals):
+        with self._lock:
+            if self._closed:
+                return
+            self._target = regvals
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                regvals, self._target = self._target, None
+            if regvals is None:
+                return
+            for reg, data in regvals:
+                if self.written.get(reg.addr) != data:
+                    self.amp.write_reg(reg, data)
+                    self.written[reg.addr] = bytes(data)
+
+    def close(self):
+        """ write the pending values, no writes happen after close() returned """
+        with self._lock:
+            self._closed = True
+            timer = self._timer
+            if timer is not None:
+                timer.cancel()
+        if timer is not None and timer is not threading.current_thread():
+            timer.join()
+        # waits for a flush of an earlier timer still running
+        self.flush()
+
+
+class Previewer:
+    def __init__(self, editor, other=None, channel='ch1', writer=None):
+        """ c'tor
+        :param editor: BandEditor of the edited channel
+        :param other: Cascade of the other channel, None: same as edited channel
+        :param channel: edited channel, 'ch1' or 'ch2'
+        :param writer: optional DebouncedWriter
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.widgets import Slider
+
+        self.editor = editor
+        self.other = other
+        self.channel = channel
+        self.writer = writer
+
+        params = [[key for key in RANGES if np.isscalar(band.get(key))] for band in editor.bands]
+        rows = len(params)
+        self.fig = plt.figure(figsize=(12, 6 + 0.3 * rows))
+        self.ax = self.fig.add_axes((0.08, 0.1 + 0.35 * rows / (rows + 10), 0.88, 0.55))
+        self.ax.set_title('Equalizer Design')
+        self.ax.set_xscale('log')
+        self.ax.set_xlim(RANGES['f'][0], editor.fs / 2)
+        self.ax.set_ylim(-15, 15)
+        self.ax.set_xlabel('Frequency [Hz]')
+        self.ax.set_ylabel('Amplitude [dB]')
+        self.ax.grid(True, color='0.2', linestyle='-', which='major', axis='both')
+        self.ax.grid(True, color='0.7', linestyle='-', which='minor', axis='both')
+
+        f = editor.f
+        self.lines = [self.ax.plot(f, _amp_db(h), alpha=0.7, animated=True)[0] for h in editor.h]
+        self.total_line = self.ax.plot(f, _amp_db(editor.total), alpha=0.3, linewidth=7, animated=True)[0]
+
+        self.sliders = []
+        height = 0.3 * rows / (rows + 10) / max(rows, 1)
+        for k, keys in enumerate(params):
+            for col, key in enumerate(keys):
+                lo, hi = RANGES[key]
+                rect = (0.08 + col * 0.23, 0.05 + (rows - 1 - k) * height, 0.15, height * 0.8)
+                slider_ax = self.fig.add_axes(rect)
+                value = editor.bands[k][key]
+                if key == 'f':
+                    # logarithmic frequency slider
+                    slider = Slider(slider_ax, '{} {}'.format(k, key), np.log10(lo), np.log10(min(hi, 0.45 * editor.fs)),
+                                    valinit=np.log10(value))
+                    slider.valtext.set_text('{:.0f}'.format(value))
+                else:
+                    slider = Slider(slider_ax, '{} {}'.format(k, key), lo, hi, valinit=value)
+                slider.drawon = False
+                slider.on_changed(self._on_changed(k, key, slider))
+                self.sliders.append(slider)
+
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_changed(self, k, key, slider):
+        def changed(value):
+            if key == 'f':
+                value = 10 ** value
+                slider.valtext.set_text('{:.0f}'.format(value))
+            h = self.editor.set_param(k, key, float(value))
+            self.lines[k].set_ydata(_amp_db(h))
+            self.total_line.set_ydata(_amp_db(self.editor.total))
+            self._blit(slider.ax)
+            if self.writer is not None:
+                self.writer.update(self.regvals())
+        return changed
+
+    def _on_draw(self, event):
+        # full redraw (initial, resize): grab the static background
+        canvas = self.fig.canvas
+        self.background = canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_curves()
+
+    def _draw_curves(self):
+        for line in self.lines + [self.total_line]:
+            self.ax.draw_artist(line)
+
+    def _blit(self, slider_ax):
+        canvas = self.fig.canvas
+        if self.background is None:
+            return
+        canvas.restore_region(self.background)
+        self._draw_curves()
+        canvas.blit(self.ax.bbox)
+        slider_ax.redraw_in_frame()
+        canvas.blit(slider_ax.bbox)
+        canvas.flush_events()
+
+    def regvals(self):
+        from tas5713 import TAS5713
+
+        bqs = self.editor.cascade()
+        other = bqs if self.other is None else self.other
+        channels = (bqs, other) if self.channel == 'ch1' else (other, bqs)
+        return TAS5713.bq_reg_value(*channels)
+
+    def show(self):
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+def _amp_db(h):
+    return 20 * np.log10(np.maximum(np.abs(h), 1e-12))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='interactive TAS5713 equalizer previewer')
+    parser.add_argument('library', help='preset library (.json, .toml)')
+    parser.add_argument('preset', help='name of the preset')
+    parser.add_argument('--fs', type=float, default=None, help='sample rate, default: first one of the preset')
+    parser.add_argument('--channel', choices=preset.CHANNELS, default='ch1', help='edited channel')
+    parser.add_argument('--live', action='store_true', help='write changes to the TAS5713')
+    args = parser.parse_args(argv)
+
+    spec = preset.load_library(args.library)[args.preset]
+    fs = args.fs or preset._sample_rates(args.preset, spec)[0]
+    bands = preset._channel_bands(args.preset, spec)
+    k = preset.CHANNELS.index(args.channel)
+
+    other = None
+    if 'channels' in spec:
+        other = preset.design(args.preset, spec, fs)[1 - k]
+
+    editor = BandEditor(bands[k], fs)
+
+    amp = writer = None
+    if args.live:
+        from tas5713 import TAS5713
+        amp = TAS5713()
+        writer = DebouncedWriter(amp)
+
+    try:
+        viewer = Previewer(editor, other, args.channel, writer)
+        if writer is not None:
+            writer.update(viewer.regvals())
+        viewer.show()
+    finally:
+        if writer is not None:
+            writer.close()
+        if amp is not None:
+            amp.close()
+
+    print(json.dumps(editor.bands, indent=2))
+
+
+if __name__ == "__main__":
+    main()
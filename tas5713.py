@@ -7,8 +7,29 @@ Ti TAS5713 I2C interface and register set definitions
 
 import struct
 from struct import Struct
+import numpy as np
 from smbus2 import SMBus
 
+from cascade import as_cascade
+
+IMAGE_MAGIC = b'TAS5713\x01'
+
+# coefficients are x.23 fixpoint in 32 bit words, 3.23 ones use the lower 26 bits only
+COEF_3_23_MASK = 0x03FFFFFF
+COEF_9_23_MASK = 0xFFFFFFFF
+
+
+def fixpoint(values, mask=COEF_3_23_MASK):
+    """ Convert values to big endian x.23 fixpoint words
+    :param values: array_like of float
+    :param mask: COEF_3_23_MASK or COEF_9_23_MASK
+    :return: bytes, 4 bytes per value
+    """
+    fix = np.round(np.asarray(values, dtype=np.float64) * 2 ** 23).astype(np.int64)
+    # mask out the unused upper bits, not really necessary but when read back the register these bits
+    # are masked-out as well and they become comparable.
+    return (fix & mask).astype('>u4').tobytes()
+
 
 class Reg:
     def __init__(self, addr, size='B'):
@@ -23,12 +44,17 @@ class Reg:
     def hex(self, data):
         if isinstance(data, int):
             return '{{:0{}X}}'.format(self.size * 2).format(data)
+        if isinstance(data, (bytes, bytearray)):
+            return ' '.join(['{:02X}'.format(i) for i in data])
         ## TODO: handle tuples, lists
         return data
 
 
 class BQReg(Reg):
     size = 20
+    # b0, b1, b2 as they are, a1, a2 negated
+    _coef_sign = np.array((1., 1., 1., -1., -1.))
+
     def __init__(self, addr):
         Reg.__init__(self, addr, size=BQReg.size)
 
@@ -43,21 +69,34 @@ class BQReg(Reg):
         :param a:
         :return: 20-byte bytearray
         """
-        reg = bytearray()
-        coef_fmt = struct.Struct('>i')  # big endian, signed, 2's-complement
-        for b_co in b:
-            reg += coef_fmt.pack(int(round(b_co * 2 ** 23)))  ## workaround: int() needed by py3.5.3
-            # mask out the first 6 bits, not really necessary but when read back the register these bits
-            # are masked-out as well and they become comparable.
-            reg[-4] &= 0x03
-
-        for a_co in a[1:]:
-            reg += coef_fmt.pack(int(round(-a_co * 2 ** 23)))  ## workaround: int() needed by py3.5.3
-            reg[-4] &= 0x03
-
+        reg = bytearray(BQReg.sos_to_reg(np.concatenate((np.real(b), np.real(a)))))
         assert len(reg) == BQReg.size
         return reg
 
+    @staticmethod
+    def sos_to_reg(sos):
+        """ Convert a whole cascade of biquads (sos format, a0 = 1) at once to tas5713
+            conform values (3.23 fixpoint, negative a's, without a0)
+        :param sos: array_like of shape (n, 6) or Cascade
+        :return: bytes, 20 bytes per section
+        """
+        sos = np.asarray(sos).reshape(-1, 6)
+        return fixpoint(sos[:, (0, 1, 2, 4, 5)] * BQReg._coef_sign)
+
+    @staticmethod
+    def reg_to_sos(reg_data):
+        """ Inverse of sos_to_reg, converts the data of one or more BQ registers at once
+        :param reg_data: bytes, 20 bytes per biquad
+        :return: sos array of shape (n, 6)
+        """
+        fix = np.frombuffer(bytes(reg_data), dtype='>u4').astype(np.int64) & COEF_3_23_MASK
+        # sign extension of the 26 bit values
+        fix = (fix ^ 0x02000000) - 0x02000000
+        coefs = fix.reshape(-1, 5) * BQReg._coef_sign * 2 ** -23
+        sos = np.ones((len(coefs), 6))
+        sos[:, (0, 1, 2, 4, 5)] = coefs
+        return sos
+
     @staticmethod
     def reg_to_ba(reg_data):
         """
@@ -102,13 +141,28 @@ class TAS5713(SMBus):
     INPUT_MULTIPLEXER_reg = Reg(0x20, '>I')
     CHANNEL_4_SOURCE_SELECT_reg = Reg(0x21, '>I')
     PWM_OUTPUT_MUX_reg = Reg(0x25, '>I')
-    DRC_CTRL_reg = Reg(0x46, '>I')
+    # dynamic range control, DRC1: CH1/CH2, DRC2: CH4
+    DRC1_AE_reg = Reg(0x3A, 8)  # energy filter: ae, 1-ae (3.23)
+    DRC1_AA_reg = Reg(0x3B, 8)  # attack: aa, 1-aa (3.23)
+    DRC1_AD_reg = Reg(0x3C, 8)  # decay: ad, 1-ad (3.23)
+    DRC2_AE_reg = Reg(0x3D, 8)
+    DRC2_AA_reg = Reg(0x3E, 8)
+    DRC2_AD_reg = Reg(0x3F, 8)
+    DRC1_T_reg = Reg(0x40, 4)   # threshold (9.23)
+    DRC1_K_reg = Reg(0x41, 4)   # slope (3.23)
+    DRC1_O_reg = Reg(0x42, 4)   # offset (3.23)
+    DRC2_T_reg = Reg(0x43, 4)
+    DRC2_K_reg = Reg(0x44, 4)
+    DRC2_O_reg = Reg(0x45, 4)
+    DRC_CTRL_reg = Reg(0x46, 4)  # bit 0: DRC1 enable, bit 1: DRC2 enable
     BANK_SWT_EQ_CTRL_reg = Reg(0x50, '>I')
     CH1_BQ_reg = [BQReg(r) for r in range(0x29, 0x2F+1)] + [BQReg(0x58), BQReg(0x59)]
     CH2_BQ_reg = [BQReg(r) for r in range(0x30, 0x36+1)] + [BQReg(0x5C), BQReg(0x5D)]
     CH1b_BQ_reg = [BQReg(0x5A), BQReg(0x5B)]  # alias Channel 4
     CH2b_BQ_reg = [BQReg(0x5E), BQReg(0x5F)]  # alias Channel 3
 
+    _reg_map = {}  # sub-address -> Reg, see reg_by_addr()
+
     def __init__(self, bus=1, device_address=0x1b):
         """ c'tor
         :param bus:             I2C bus id, on raspi normally 1
@@ -137,25 +191,81 @@ class TAS5713(SMBus):
         return self.write_i2c_block_data(self.addr, reg.addr, data)
 
     @staticmethod
-    def bq_reg_value(bqs):
+    def bq_reg_value(bqs, bqs_ch2=None):
         """Calculates the whole biquad register values of TAS5713.
-        :param bqs: list of biquad coefficients
-        :type bqs: list[[b=tuple(3), a=tuple(3)],...]
-        :return: list[tuple(Reg, bytearray(20)),...]
+        :param bqs: biquad cascade for CH1 (and CH2 if `bqs_ch2` is not given)
+        :type bqs: Cascade, array of shape (n, 6) or list[[b=tuple(3), a=tuple(3)],...]
+        :param bqs_ch2: optional, separate biquad cascade for CH2
+        :return: list[tuple(Reg, bytes(20)),...]
         """
-        assert len(bqs) <= len(TAS5713.CH1_BQ_reg)
+        if bqs_ch2 is None:
+            bqs_ch2 = bqs
 
         # regvals: list of tuple(reg, bytes(20)),
-        # list of int instead of bytes() or bytearray()
+        # unused biquads are filled up with the default biquad b0=1, a0=1
+        regvals = []
+        for bqs, ch in ((bqs, TAS5713.CH1_BQ_reg), (bqs_ch2, TAS5713.CH2_BQ_reg)):
+            data = BQReg.sos_to_reg(as_cascade(bqs).padded(len(ch)))
+            for i, reg in enumerate(ch):
+                regvals.append((reg, data[i * BQReg.size:(i + 1) * BQReg.size]))
+        return regvals
+
+    @staticmethod
+    def reg_by_addr(addr):
+        """ lookup the register definition of a sub-address
+        :param addr: register sub-address
+        :return: Reg
+        """
+        if not TAS5713._reg_map:
+            for value in vars(TAS5713).values():
+                for reg in (value if isinstance(value, list) else [value]):
+                    if isinstance(reg, Reg):
+                        TAS5713._reg_map[reg.addr] = reg
+        return TAS5713._reg_map[addr]
+
+    @staticmethod
+    def save_image(path, regvals):
+        """ Store register values as precompiled register image.
+
+        Image layout: 8 bytes magic, followed by records of
+        sub-address (1 byte), data length (1 byte) and data.
+
+        :param path: file name
+        :param regvals: list[tuple(Reg, bytes),...]
+        """
+        image = bytearray(IMAGE_MAGIC)
+        for reg, data in regvals:
+            image += bytes((reg.addr, len(data))) + bytes(data)
+        with open(path, 'wb') as f:
+            f.write(image)
+
+    @staticmethod
+    def load_image(path):
+        """ Read a precompiled register image, see `save_image`
+        :param path: file name
+        :return: list[tuple(Reg, bytes),...]
+        :raises ValueError: if the file is no valid image
+        """
+        with open(path, 'rb') as f:
+            image = f.read()
+        if image[:len(IMAGE_MAGIC)] != IMAGE_MAGIC:
+            raise ValueError('{}: not a TAS5713 register image'.format(path))
+
         regvals = []
-        for ch in (TAS5713.CH1_BQ_reg, TAS5713.CH2_BQ_reg):
-            for bq, reg in zip(bqs, ch):
-                regvals.append((reg, BQReg.ba_to_reg(*bq)))
-
-            # fill up with the default biquad b0=1, a0=1
-            bq_def = BQReg.ba_to_reg((1., 0., 0.), (1., 0., 0.))
-            for reg in ch[len(bqs):]:
-                regvals.append((reg, bq_def))
+        pos = len(IMAGE_MAGIC)
+        while pos < len(image):
+            if pos + 2 > len(image):
+                raise ValueError('{}: truncated record at offset {}'.format(path, pos))
+            addr, size = image[pos], image[pos + 1]
+            data = image[pos + 2:pos + 2 + size]
+            try:
+                reg = TAS5713.reg_by_addr(addr)
+            except KeyError:
+                raise ValueError('{}: unknown register 0x{:02X} at offset {}'.format(path, addr, pos))
+            if len(data) != size or size != reg.size:
+                raise ValueError('{}: corrupt record at offset {}'.format(path, pos))
+            regvals.append((reg, data))
+            pos += 2 + size
         return regvals
 
 
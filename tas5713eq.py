@@ -3,20 +3,120 @@
 
 """
 TAS5713 biquad/equalizer settings.
+
+usage: tas5713eq.py [--journal FILE | --no-journal] [--rollback] [image]
+
+Without argument the biquads of equalizer.py are calculated, otherwise the
+precompiled register image (see preset.py) is written as it is.
+
+The progress is recorded in a write-ahead journal (see journal.py). If a
+previous run was interrupted, the next run resumes at the first register
+which was not verified yet (the ones before are checked by reading them
+back). `--rollback` restores the last completely programmed bank instead.
+
+Instrumentation, enabled by environment variables:
+  TAS5713EQ_METRICS      write phase timings, I2C latencies and retries as JSON to this file ('-': stdout)
+  TAS5713EQ_PROMETHEUS   write the same as Prometheus textfile
+  TAS5713EQ_PROFILE      run under cProfile and dump the stats to this file
 """
 
+import argparse
+import os
 import sys
 import time
 
-import equalizer
+_t_import = time.perf_counter()
+
+from instrument import Metrics, profiled
+from journal import Journal
 from tas5713 import TAS5713
 
 
-if __name__ == "__main__":
+def _same(regvals_a, regvals_b):
+    return [(r.addr, bytes(d)) for r, d in regvals_a] == [(r.addr, bytes(d)) for r, d in regvals_b]
+
+
+def program(amp, cmd_lst, metrics, journal=None, rollback=False):
+    """ Write and verify the register values, journaled if `journal` is given.
+    :return: True if all registers are verified
+    """
+    start = 0
+    if journal is not None:
+        previous = None
+        with metrics.phase('journal'):
+            pending = journal.pending()
+        if pending is not None:
+            target, previous, verified = pending
+            if rollback:
+                print('rollback to the previous bank')
+                cmd_lst = previous
+            elif _same(target, cmd_lst):
+                print('resume at register {} of {}'.format(verified, len(cmd_lst)))
+                start = verified
+        elif rollback:
+            print('nothing to roll back')
+            return True
+        else:
+            previous = journal.last_bank()
+
+        if previous is None:
+            # first run, the current content of the amp is the previous bank
+            previous = []
+            for reg, _ in cmd_lst:
+                with metrics.phase('readback'), metrics.transaction('read'):
+                    previous.append((reg, amp.read_reg(reg)))
+        with metrics.phase('journal'):
+            journal.begin(cmd_lst, previous, start)
+
+    ok = True
+    for i, (reg, data) in enumerate(cmd_lst):
+        if i < start:
+            # verified by the interrupted run, only rewrite if the amp lost it (e.g. power cycle)
+            with metrics.phase('readback'), metrics.transaction('read'):
+                read = amp.read_reg(reg)
+            if read == data:
+                print('[{}]:{:02X}: {}'.format('OK', reg.addr, reg.hex(data)))
+                continue
+
+        with metrics.phase('write'), metrics.transaction('write'):
+            amp.write_reg(reg, data)
+
+        # verify it is really written, at least print something useful ...
+        with metrics.phase('readback'), metrics.transaction('read'):
+            read = amp.read_reg(reg)
+        print('[{}]:{:02X}: {}'.format('OK' if read == data else 'FAIL', reg.addr, reg.hex(data)))
+
+        if read != data:
+            ok = False
+        elif journal is not None and i >= start:
+            with metrics.phase('journal'):
+                journal.verified(i)
+
+    if journal is not None:
+        with metrics.phase('journal'):
+            if ok:
+                journal.commit(cmd_lst)
+            else:
+                journal.close()
+    return ok
+
 
-    fs = 46e3  # use something in between 44.1kHz and 48kHz, the common sample rates of my music
-    biquad_param = equalizer.parameters(fs)
-    cmd_lst = TAS5713.bq_reg_value(biquad_param)
+def main(metrics, args):
+    if args.image:
+        with metrics.phase('load_image'):
+            try:
+                cmd_lst = TAS5713.load_image(args.image)
+            except (OSError, ValueError) as e:
+                print(e, file=sys.stderr)
+                return 1
+    else:
+        with metrics.phase('imports'):
+            import equalizer
+        with metrics.phase('design'):
+            fs = 46e3  # use something in between 44.1kHz and 48kHz, the common sample rates of my music
+            biquad_param = equalizer.parameters(fs)
+        with metrics.phase('quantization'):
+            cmd_lst = TAS5713.bq_reg_value(biquad_param)
 
     # connect to the tas5713 and try to write the CH1-BQ and CH2-BQ2 register set
     con_attempts = 5
@@ -24,20 +124,42 @@ if __name__ == "__main__":
     while amp is None:
         try:
             # try to open, sometimes the linux kernel driver is still accessing the i2c-1 bus and open() fails
-            amp = TAS5713()
+            with metrics.phase('bus_open'):
+                amp = TAS5713()
         except: ## TODO: catch the right exception only
             if con_attempts == 0:
-                sys.exit(1)
+                return 1
             con_attempts -= 1
-            time.sleep(5.0)
+            metrics.retry('bus_open')
+            with metrics.phase('bus_open_wait'):
+                time.sleep(5.0)
 
+    journal = None if args.no_journal else Journal(args.journal)
     try:
-        for reg, data in cmd_lst:
-            amp.write_reg(reg, data)
-
-            # verify it is really written, at least print something useful ...
-            read = amp.read_reg(reg)
-            print('[{}]:{:02X}: {}'.format('OK' if read == data else 'FAIL', reg.addr, reg.hex(data)))
+        ok = program(amp, cmd_lst, metrics, journal, args.rollback)
     finally:
-        if amp is not None:
+        with metrics.phase('bus_close'):
             amp.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='write the TAS5713 biquad registers')
+    parser.add_argument('image', nargs='?', help='precompiled register image, default: equalizer.py')
+    parser.add_argument('--journal', default='tas5713eq.journal', help='write-ahead journal file')
+    parser.add_argument('--no-journal', action='store_true', help='do not journal the progress')
+    parser.add_argument('--rollback', action='store_true',
+                        help='restore the last complete bank after an interrupted run')
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    metrics.add_phase('imports', time.perf_counter() - _t_import)
+    try:
+        with profiled(os.environ.get('TAS5713EQ_PROFILE')):
+            exit_code = main(metrics, args)
+    finally:
+        if os.environ.get('TAS5713EQ_METRICS'):
+            metrics.write_json(os.environ['TAS5713EQ_METRICS'])
+        if os.environ.get('TAS5713EQ_PROMETHEUS'):
+            metrics.write_prometheus(os.environ['TAS5713EQ_PROMETHEUS'])
+    sys.exit(exit_code)